@@ -1,15 +1,42 @@
 from __future__ import annotations
 
 import base64
-from typing import Any, Dict, List, Optional
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from app.core.rest_transport import DEFAULT_BASE_URL, RestError, RestTransport, response_parts, response_text
 
 
 class GeminiClient:
-    def __init__(self, api_key: str) -> None:
+    # transport="sdk" goes through google.generativeai; transport="rest" uses
+    # a pooled keep-alive HTTP client (see app/core/rest_transport.py).
+    def __init__(
+        self,
+        api_key: str,
+        transport: str = "sdk",
+        base_url: Optional[str] = None,
+        http2: bool = False,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+    ) -> None:
         self.api_key = api_key
-        if api_key:
+        self.read_timeout = read_timeout
+        self._rest: Optional[RestTransport] = None
+        # SDK CachedContent objects by name, needed to build models on them
+        self._sdk_caches: Dict[str, Any] = {}
+        if transport == "rest":
+            self._rest = RestTransport(
+                api_key,
+                base_url=base_url or DEFAULT_BASE_URL,
+                http2=http2,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+            )
+        elif api_key:
             genai.configure(api_key=api_key)
 
     def is_ready(self) -> bool:
@@ -25,27 +52,118 @@ class GeminiClient:
             data = base64.b64encode(f.read()).decode("utf-8")
         return {"inline_data": {"mime_type": mime, "data": data}}
 
+    def _model(self, model_id: str, system_instruction: Optional[str], cached_content: Optional[str]) -> Any:
+        if cached_content:
+            cached = self._sdk_caches.get(cached_content, cached_content)
+            return genai.GenerativeModel.from_cached_content(cached_content=cached)
+        return genai.GenerativeModel(model_id, system_instruction=system_instruction or "")
+
+    # Context caching (see app/core/context_cache.py)
+    def create_cache(
+        self,
+        model_id: str,
+        system_instruction: Optional[str],
+        contents: List[Dict[str, Any]],
+        ttl_s: int,
+    ) -> Tuple[str, float]:
+        if self._rest is not None:
+            res = self._rest.create_cached_content(model_id, contents, system_instruction, ttl_s)
+            return res["name"], _parse_expiry(res.get("expireTime"), ttl_s)
+        cached = genai.caching.CachedContent.create(
+            model=model_id,
+            system_instruction=system_instruction or None,
+            contents=contents,
+            ttl=timedelta(seconds=ttl_s),
+        )
+        self._sdk_caches[cached.name] = cached
+        expire = getattr(cached, "expire_time", None)
+        return cached.name, expire.timestamp() if expire else time.time() + ttl_s
+
+    def delete_cache(self, name: str) -> None:
+        if self._rest is not None:
+            self._rest.delete_cached_content(name)
+            return
+        cached = self._sdk_caches.pop(name, None) or genai.caching.CachedContent.get(name)
+        cached.delete()
+
+    def is_cache_miss(self, error: Exception) -> bool:
+        # The request named a cachedContent the provider no longer has (404),
+        # or rejected it as invalid (400 mentioning the cache)
+        if isinstance(error, RestError):
+            status, message = error.status, str(error)
+        elif isinstance(error, google_exceptions.GoogleAPICallError):
+            status, message = int(error.code or 0), error.message or ""
+        else:
+            return False
+        return status == 404 or (status == 400 and "cache" in message.lower())
+
     def chat(
         self,
         model_id: str,
         messages: List[Dict[str, Any]],
         system_instruction: Optional[str] = None,
+        cached_content: Optional[str] = None,
     ) -> str:
+        # With cached_content, `messages` continue the cached prefix and the
+        # system instruction is the one stored in the cache
         if not self.is_ready():
             return "Error: GOOGLE_API_KEY not set."
-        model = genai.GenerativeModel(model_id, system_instruction=system_instruction or "")
+        if self._rest is not None:
+            return response_text(self._rest.generate_content(
+                model_id, messages, system_instruction, cached_content=cached_content))
+        model = self._model(model_id, system_instruction, cached_content)
         # messages: [{"role":"user|model","parts":[...]}]
         res = model.generate_content(messages)
         return res.text or ""
 
-    def generate_image(self, prompt: str, model_id: str = "gemini-flash-image") -> Optional[bytes]:
+    def chat_stream(
+        self,
+        model_id: str,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        cached_content: Optional[str] = None,
+    ) -> Iterator[str]:
+        # Yields the reply in chunks as they are generated
         if not self.is_ready():
+            yield "Error: GOOGLE_API_KEY not set."
+            return
+        if self._rest is not None:
+            events = self._rest.stream_generate_content(
+                model_id, messages, system_instruction, cached_content=cached_content)
+            for event in events:
+                text = response_text(event)
+                if text:
+                    yield text
+            return
+        model = self._model(model_id, system_instruction, cached_content)
+        for chunk in model.generate_content(messages, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    def generate_image(
+        self,
+        prompt: str,
+        model_id: str = "gemini-flash-image",
+        config: Optional[Dict[str, Any]] = None,
+    ) -> Optional[bytes]:
+        if not self.is_ready():
+            return None
+        if self._rest is not None:
+            data = self._rest.generate_content(
+                model_id,
+                [{"role": "user", "parts": [{"text": prompt}]}],
+                generation_config={"response_mime_type": "image/png", **(config or {})},
+            )
+            for part in response_parts(data):
+                inline = part.get("inlineData") or part.get("inline_data")
+                if inline:
+                    return base64.b64decode(inline["data"])
             return None
         model = genai.GenerativeModel(model_id)
         res = model.generate_content(
             [prompt],
-            request_options={"timeout": 120},
-            generation_config={"response_mime_type": "image/png"},
+            request_options={"timeout": self.read_timeout},
+            generation_config={"response_mime_type": "image/png", **(config or {})},
         )
         # SDK returns an image part; support both bytes and base64 paths
         for part in res._result.candidates[0].content.parts:
@@ -56,9 +174,22 @@ class GeminiClient:
     def summarize_title(self, text: str, model_id: str = "gemini-1.5-flash") -> str:
         if not self.is_ready():
             return "New Chat"
-        model = genai.GenerativeModel(model_id)
         prompt = f"Summarize this prompt into a short, 3-5 word title: {text}"
+        if self._rest is not None:
+            contents = [{"role": "user", "parts": [{"text": prompt}]}]
+            title = response_text(self._rest.generate_content(model_id, contents))
+            return (title or "New Chat").strip().strip('"')
+        model = genai.GenerativeModel(model_id)
         res = model.generate_content([prompt])
         return (res.text or "New Chat").strip().strip('"')
 
 
+def _parse_expiry(value: Optional[str], ttl_s: int) -> float:
+    # RFC 3339 with up to nanosecond precision, e.g. 2024-06-01T12:00:00.123456789Z
+    if value:
+        head, _, frac = value.rstrip("Z").partition(".")
+        try:
+            return datetime.fromisoformat(head + "+00:00").timestamp() + float("0." + (frac or "0"))
+        except ValueError:
+            pass
+    return time.time() + ttl_s
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+# Message.images entries of this form point into the store; anything else is
+# a plain file path from before the store existed
+REF_PREFIX = "sha256:"
+CHUNK = 1 << 20
+_DATA_CACHE = 32
+
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def is_ref(ref: str) -> bool:
+    return ref.startswith(REF_PREFIX)
+
+
+def _sniff_mime(head: bytes, path: Path) -> str:
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+
+class AttachmentStore:
+    # Attachments are stored once as <dir>/<sha256><ext>: the file is hashed
+    # in chunks first and only copied when the hash is new, so attaching the
+    # same file again reads it once and writes nothing. Derived forms sit
+    # next to it: <sha256>.json (MIME type, size, image dimensions) and
+    # <sha256>.b64 (the base64 payload that both the HTML views and the API
+    # requests need), encoded during the copy.
+    def __init__(self, directory: Optional[Path] = None) -> None:
+        self.dir = directory
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+    def open(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        self.dir = directory
+
+    def ingest(self, path: str) -> str:
+        # Returns the reference to store in Message.images. Without a store
+        # directory the path itself is kept, as before.
+        if self.dir is None:
+            return path
+        src = Path(path)
+        h = hashlib.sha256()
+        head = b""
+        with src.open("rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK), b""):
+                if not head:
+                    head = chunk[:16]
+                h.update(chunk)
+        digest = h.hexdigest()
+        if self._meta_path(digest).exists():
+            return REF_PREFIX + digest
+        mime = _sniff_mime(head, src)
+        blob = self.dir / (digest + (mimetypes.guess_extension(mime) or src.suffix.lower()))
+        tmp = self.dir / f".ingest-{threading.get_ident()}.tmp"
+        tmp_b64 = self.dir / f".ingest-{threading.get_ident()}.b64.tmp"
+        check = hashlib.sha256()
+        try:
+            with src.open("rb") as f, tmp.open("wb") as out, tmp_b64.open("wb") as out_b64:
+                # Multiples of 3 bytes encode without padding, so chunks concatenate
+                for chunk in iter(lambda: f.read(3 * CHUNK), b""):
+                    check.update(chunk)
+                    out.write(chunk)
+                    out_b64.write(base64.b64encode(chunk))
+            if check.hexdigest() != digest:
+                raise OSError(f"{src} changed while it was being attached")
+            os.replace(tmp, blob)
+            os.replace(tmp_b64, self._b64_path(digest))
+        finally:
+            tmp.unlink(missing_ok=True)
+            tmp_b64.unlink(missing_ok=True)
+        meta: Dict[str, Any] = {"mime": mime, "size": blob.stat().st_size, "file": blob.name, "name": src.name}
+        try:
+            with Image.open(blob) as im:
+                meta["width"], meta["height"] = im.size
+        except Exception:
+            pass
+        # The metadata file is written last: its presence marks a complete entry
+        self._meta_path(digest).write_text(json.dumps(meta), encoding="utf-8")
+        return REF_PREFIX + digest
+
+    def _meta_path(self, digest: str) -> Path:
+        return self.dir / f"{digest}.json"
+
+    def _b64_path(self, digest: str) -> Path:
+        return self.dir / f"{digest}.b64"
+
+    def meta(self, ref: str) -> Optional[Dict[str, Any]]:
+        if not is_ref(ref) or self.dir is None:
+            return None
+        try:
+            return json.loads(self._meta_path(ref[len(REF_PREFIX):]).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def resolve(self, ref: str) -> Optional[Path]:
+        # File path for a store reference or a legacy plain path
+        if not is_ref(ref):
+            p = Path(ref)
+            return p if p.exists() else None
+        meta = self.meta(ref)
+        if meta is None:
+            return None
+        p = self.dir / meta["file"]
+        return p if p.exists() else None
+
+    def payload(self, ref: str) -> Optional[Tuple[str, str]]:
+        # (mime, base64) for a reference or legacy path; recent ones are kept
+        # in memory, keyed by content hash or path
+        with self._lock:
+            hit = self._data.get(ref)
+            if hit is not None:
+                self._data.move_to_end(ref)
+                return hit
+        if is_ref(ref):
+            meta = self.meta(ref)
+            if meta is None:
+                return None
+            try:
+                data = self._b64_path(ref[len(REF_PREFIX):]).read_text(encoding="ascii")
+            except OSError:
+                return None
+            result = (meta["mime"], data)
+        else:
+            p = Path(ref)
+            try:
+                raw = p.read_bytes()
+            except OSError:
+                return None
+            result = (_sniff_mime(raw[:16], p), base64.b64encode(raw).decode("ascii"))
+        with self._lock:
+            self._data[ref] = result
+            while len(self._data) > _DATA_CACHE:
+                self._data.popitem(last=False)
+        return result
+
+    def data_uri(self, ref: str) -> Optional[str]:
+        payload = self.payload(ref)
+        if payload is None:
+            return None
+        mime, data = payload
+        return f"data:{mime};base64,{data}"
+
+    def inline_data(self, ref: str) -> Optional[Dict[str, Any]]:
+        payload = self.payload(ref)
+        if payload is None:
+            return None
+        mime, data = payload
+        return {"inline_data": {"mime_type": mime, "data": data}}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            cached = sum(len(mime) + len(data) for mime, data in self._data.values())
+            entries = len(self._data)
+        stored = 0
+        if self.dir is not None:
+            stored = sum(1 for _ in self.dir.glob("*.json"))
+        return {"stored": stored, "cached": entries, "bytes": cached}
+
+
+# Shared instance; main.py opens it under the storage directory
+attachments = AttachmentStore()
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple, TypeVar
+
+from app.core.diagnostics import deep_size
+from app.core.state import AppState
+
+TTL_S = 900
+# Providers refuse to cache short prefixes; estimated at ~4 characters per token
+MIN_PREFIX_TOKENS = 4096
+IMAGE_TOKENS = 258
+# Rebuild once this many request messages are sent outside the cached prefix
+REFRESH_AFTER = 12
+# A cache is not trusted this close to its expiry
+EXPIRY_MARGIN_S = 30
+FAILURE_BACKOFF_S = 600
+
+T = TypeVar("T")
+
+
+class CacheBackend(Protocol):
+    # GeminiClient implements this; create_cache returns the provider's cache
+    # name and its expiry as a Unix timestamp
+    def create_cache(
+        self,
+        model_id: str,
+        system_instruction: Optional[str],
+        contents: List[Dict[str, Any]],
+        ttl_s: int,
+    ) -> Tuple[str, float]:
+        ...
+
+    def delete_cache(self, name: str) -> None:
+        ...
+
+    def is_cache_miss(self, error: Exception) -> bool:
+        # True when a request failed because its cache is gone or invalid
+        ...
+
+
+def estimate_tokens(system_instruction: Optional[str], contents: List[Dict[str, Any]]) -> int:
+    chars = len(system_instruction or "")
+    images = 0
+    for c in contents:
+        for p in c.get("parts", ()):
+            if "text" in p:
+                chars += len(p["text"])
+            else:
+                images += 1
+    return chars // 4 + images * IMAGE_TOKENS
+
+
+def _digest(content: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedPrefix:
+    name: str
+    model_id: str
+    system_key: str
+    digests: Tuple[str, ...]  # one per cached request message
+    expires_at: float
+    tokens: int
+
+
+@dataclass
+class CachePlan:
+    # What to send: a cache name (None = nothing cached) and the messages
+    # that come after the cached prefix
+    name: Optional[str]
+    contents: List[Dict[str, Any]]
+
+
+class PrefixCache:
+    # Keeps, per session, a provider-side cache of the system instruction plus
+    # the earlier request messages, so a turn only sends what came after.
+    #
+    # Bookkeeping is local: the cached prefix is remembered as a digest per
+    # message, and a request reuses the cache while its messages continue the
+    # cached ones. When the history window has slid past the start of the
+    # cache, the model still sees those older messages, which is harmless;
+    # the cache is rebuilt once REFRESH_AFTER messages pile up past it, or
+    # when the model, the system instruction or an earlier message changed
+    # (an edit or deletion), and always before it expires. Creation failures
+    # (model without caching, prefix too short) back off per model.
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttl_s: int = TTL_S,
+        min_tokens: int = MIN_PREFIX_TOKENS,
+        refresh_after: int = REFRESH_AFTER,
+    ) -> None:
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.min_tokens = min_tokens
+        self.refresh_after = refresh_after
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CachedPrefix] = {}
+        self._failures: Dict[str, float] = {}
+        self._stats = {"hits": 0, "misses": 0, "created": 0, "failed": 0, "lost": 0, "tokens_from_cache": 0}
+
+    def attach(self, state: AppState) -> None:
+        state.subscribe("session-deleted", self.invalidate)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            # Local bookkeeping only; the cached tokens live with the provider
+            return dict(self._stats, entries=len(self._entries), bytes=deep_size(self._entries))
+
+    def _overlap(self, entry: CachedPrefix, digests: List[str]) -> Optional[int]:
+        # Number of request messages covered by the cache, if the request
+        # continues it (possibly starting later, when the window slid)
+        cached = entry.digests
+        for skip in range(len(cached) + 1):
+            n = len(cached) - skip
+            # The last request message (the new turn) is never cached
+            if n < len(digests) and list(cached[skip:]) == digests[:n]:
+                return n
+        return None
+
+    def plan(
+        self,
+        session_id: str,
+        model_id: str,
+        system_instruction: Optional[str],
+        contents: List[Dict[str, Any]],
+        now: Optional[float] = None,
+    ) -> CachePlan:
+        now = time.time() if now is None else now
+        if not contents:
+            return CachePlan(None, contents)
+        system_key = hashlib.sha256(f"{model_id}\0{system_instruction or ''}".encode("utf-8")).hexdigest()
+        digests = [_digest(c) for c in contents]
+        with self._lock:
+            entry = self._entries.get(session_id)
+        covered: Optional[int] = None
+        if entry is not None:
+            if entry.system_key != system_key or entry.expires_at - EXPIRY_MARGIN_S <= now:
+                self._drop(session_id, entry)
+                entry = None
+            else:
+                covered = self._overlap(entry, digests)
+                if covered is None:
+                    self._drop(session_id, entry)
+                    entry = None
+        if entry is not None and covered is not None and len(contents) - covered <= self.refresh_after:
+            self._hit(entry)
+            return CachePlan(entry.name, contents[covered:])
+
+        fresh = self._create(session_id, model_id, system_key, system_instruction, contents, digests, now)
+        if fresh is not None:
+            if entry is not None:
+                self._delete_remote(entry.name)
+            self._hit(fresh)
+            return CachePlan(fresh.name, contents[-1:])
+        if entry is not None and covered is not None:
+            # Rebuilding failed, the old cache still covers part of the request
+            self._hit(entry)
+            return CachePlan(entry.name, contents[covered:])
+        with self._lock:
+            self._stats["misses"] += 1
+        return CachePlan(None, contents)
+
+    def _hit(self, entry: CachedPrefix) -> None:
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["tokens_from_cache"] += entry.tokens
+
+    def _create(
+        self,
+        session_id: str,
+        model_id: str,
+        system_key: str,
+        system_instruction: Optional[str],
+        contents: List[Dict[str, Any]],
+        digests: List[str],
+        now: float,
+    ) -> Optional[CachedPrefix]:
+        prefix = contents[:-1]
+        tokens = estimate_tokens(system_instruction, prefix)
+        if tokens < self.min_tokens:
+            return None
+        with self._lock:
+            if self._failures.get(model_id, 0.0) > now:
+                return None
+        try:
+            name, expires_at = self.backend.create_cache(model_id, system_instruction, prefix, self.ttl_s)
+        except Exception:
+            with self._lock:
+                self._failures[model_id] = now + FAILURE_BACKOFF_S
+                self._stats["failed"] += 1
+            return None
+        entry = CachedPrefix(name, model_id, system_key, tuple(digests[:-1]), expires_at, tokens)
+        with self._lock:
+            self._entries[session_id] = entry
+            self._stats["created"] += 1
+        return entry
+
+    def _drop(self, session_id: str, entry: CachedPrefix) -> None:
+        with self._lock:
+            if self._entries.get(session_id) is entry:
+                del self._entries[session_id]
+        self._delete_remote(entry.name)
+
+    def _delete_remote(self, name: str) -> None:
+        # Best effort: an undeleted cache still expires after its TTL
+        try:
+            self.backend.delete_cache(name)
+        except Exception:
+            pass
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._delete_remote(entry.name)
+
+    def clear(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._delete_remote(entry.name)
+
+    def run(
+        self,
+        session_id: str,
+        model_id: str,
+        system_instruction: Optional[str],
+        contents: List[Dict[str, Any]],
+        send: Callable[[Optional[str], List[Dict[str, Any]]], T],
+    ) -> T:
+        # send(cache_name, contents) performs the request. If the provider
+        # no longer knows the cache, the request is repeated without it; any
+        # other failure is raised as it is.
+        plan = self.plan(session_id, model_id, system_instruction, contents)
+        if plan.name is None:
+            return send(None, contents)
+        try:
+            return send(plan.name, plan.contents)
+        except Exception as e:
+            if not self.backend.is_cache_miss(e):
+                raise
+            with self._lock:
+                self._stats["lost"] += 1
+                entry = self._entries.get(session_id)
+                if entry is not None and entry.name == plan.name:
+                    del self._entries[session_id]
+            return send(None, contents)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Frames kept per tracemalloc allocation once tracing is switched on
+TRACE_FRAMES = 25
+TOP_STATS = 40
+
+
+def deep_size(obj: Any, seen: Optional[set] = None) -> int:
+    # Approximate retained size: sys.getsizeof over containers, __dict__ and
+    # __slots__, counting each object once (so interned roles and shared
+    # empty tuples are not multiplied)
+    seen = set() if seen is None else seen
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        else:
+            d = getattr(o, "__dict__", None)
+            if d is not None:
+                stack.append(d)
+            for cls in type(o).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    try:
+                        stack.append(getattr(o, slot))
+                    except AttributeError:
+                        pass
+    return total
+
+
+def _process_rss() -> Optional[int]:
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return None
+
+
+class MemoryDiagnostics:
+    # Subsystems register probes returning a dict of numbers (at least
+    # "bytes", an estimate). report() runs them all; snapshot() takes a
+    # tracemalloc snapshot and diffs it against the previous one. Everything
+    # is written as JSON under `out_dir`.
+    def __init__(self, out_dir: Path) -> None:
+        self.out_dir = out_dir
+        self._probes: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    def register(self, name: str, probe: Callable[[], Dict[str, Any]]) -> None:
+        self._probes[name] = probe
+
+    def subsystems(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for name, probe in self._probes.items():
+            try:
+                out[name] = probe()
+            except Exception as e:
+                out[name] = {"error": repr(e)}
+        return out
+
+    def report(self) -> Dict[str, Any]:
+        types = Counter(type(o).__name__ for o in gc.get_objects())
+        report: Dict[str, Any] = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "peak_rss_bytes": _process_rss(),
+            "subsystems": self.subsystems(),
+            "gc_objects": sum(types.values()),
+            "top_types": types.most_common(25),
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            report["traced_bytes"] = current
+            report["traced_peak_bytes"] = peak
+        return report
+
+    def snapshot(self) -> Dict[str, Any]:
+        # The first call only starts tracing (allocations made before that
+        # are invisible); later calls report the top growth since the last.
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self._previous = tracemalloc.take_snapshot()
+            return {"tracing": "started"}
+        snap = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        out: Dict[str, Any] = {"top": self._format(snap.statistics("lineno")[:TOP_STATS])}
+        if self._previous is not None:
+            diff = snap.compare_to(self._previous, "traceback")[:TOP_STATS]
+            out["growth"] = [
+                {
+                    "size_diff": s.size_diff,
+                    "count_diff": s.count_diff,
+                    "size": s.size,
+                    "traceback": s.traceback.format()[-8:],
+                }
+                for s in diff
+                if s.size_diff > 0
+            ]
+        self._previous = snap
+        return out
+
+    @staticmethod
+    def _format(stats: List[tracemalloc.Statistic]) -> List[Dict[str, Any]]:
+        return [{"where": str(s.traceback[0]), "size": s.size, "count": s.count} for s in stats]
+
+    def write(self, with_snapshot: bool = True) -> Path:
+        data = self.report()
+        if with_snapshot:
+            data["tracemalloc"] = self.snapshot()
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        path = self.out_dir / f"memory-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        path.write_text(json.dumps(data, indent=2, default=str), encoding="utf-8")
+        return path
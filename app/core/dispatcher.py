@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+Job = Tuple[Callable[[], Any], Optional[Callable[[Any], None]]]
+
+
+class RequestDispatcher:
+    # One FIFO per session: a session's jobs run strictly in order, while
+    # different sessions run in parallel on a shared pool. on_done gets the
+    # job's result once the job has left the queue, so is_pending() already
+    # reflects it there; it is not called when the job raised.
+    def __init__(self, max_parallel: int = 4) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="pytalk-request")
+        self._queues: Dict[str, Deque[Job]] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        session_id: str,
+        job: Callable[[], Any],
+        on_done: Optional[Callable[[Any], None]] = None,
+    ) -> None:
+        with self._lock:
+            q = self._queues.get(session_id)
+            if q is not None:
+                q.append((job, on_done))
+                return
+            self._queues[session_id] = deque([(job, on_done)])
+        self._pool.submit(self._drain, session_id)
+
+    def pending(self, session_id: str) -> int:
+        # Queued plus running
+        with self._lock:
+            q = self._queues.get(session_id)
+            return len(q) if q else 0
+
+    def is_pending(self, session_id: str) -> bool:
+        return self.pending(session_id) > 0
+
+    def _drain(self, session_id: str) -> None:
+        while True:
+            with self._lock:
+                job, on_done = self._queues[session_id][0]
+            failed = False
+            result = None
+            try:
+                result = job()
+            except Exception:
+                failed = True
+            with self._lock:
+                q = self._queues[session_id]
+                q.popleft()
+                if not q:
+                    del self._queues[session_id]
+            if on_done is not None and not failed:
+                try:
+                    on_done(result)
+                except Exception:
+                    pass
+            if not q:
+                return
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
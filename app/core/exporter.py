@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import hashlib
+import html
+import os
+import re
+import shutil
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.attachments import attachments, is_ref
+from app.core.markdown_renderer import render_markdown_body, stylesheet
+from app.core.state import AppState, ChatSession, Message
+
+STYLESHEET_NAME = "pytalk.css"
+# Below this many messages the process pool costs more than it saves
+POOL_THRESHOLD = 200
+CHUNK_SIZE = 32
+
+_EXPORT_CSS = """
+      .msg {
+        max-width: 72%;
+        margin: 8px;
+        padding: 10px 12px;
+        border-radius: 12px;
+      }
+      .msg.user {
+        background: #4f46e5;
+        color: #ffffff;
+        margin-left: auto;
+      }
+      .msg.assistant, .msg.system {
+        background: #374151;
+        color: #e5e7eb;
+        margin-right: auto;
+      }
+      .msg time {
+        display: block;
+        font-size: 11px;
+        opacity: 0.6;
+      }
+"""
+
+
+def _render_body(content: str) -> str:
+    # Runs in pool workers; must stay importable at module level
+    return render_markdown_body(content)
+
+
+def _slug(title: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", title).strip("-").lower()
+    return slug[:48] or "chat"
+
+
+class SessionExporter:
+    # Writes each session to <out>/<slug>-<id>.html, streaming one message at a
+    # time. All pages link one pytalk.css, images are copied once into images/
+    # and referenced by file. Markdown + highlighting fan out over a process pool.
+    # Sessions are read one at a time; with `state`, histories that were not
+    # loaded before go back to disk once their page is written.
+    def __init__(self, out_dir: Path, workers: Optional[int] = None, state: Optional[AppState] = None) -> None:
+        self.out_dir = out_dir
+        self.state = state
+        self.images_dir = out_dir / "images"
+        self.workers = workers or os.cpu_count() or 1
+        self._images: Dict[str, str] = {}
+
+    def export(
+        self,
+        sessions: Iterable[ChatSession],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> List[Path]:
+        # Progress counts sessions: message counts are only known once a
+        # session's history is read
+        sessions = list(sessions)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        (self.out_dir / STYLESHEET_NAME).write_text(stylesheet() + _EXPORT_CSS, encoding="utf-8")
+        pool: Optional[Executor] = None
+        rendered = 0
+        paths: List[Path] = []
+        entries: List[Tuple[ChatSession, Path, int]] = []
+        try:
+            for done, s in enumerate(sessions, 1):
+                loaded = s.is_materialized()
+                messages = list(s.messages)
+                count = len(messages)
+                rendered += count
+                if pool is None and rendered >= POOL_THRESHOLD and self.workers > 1:
+                    pool = ProcessPoolExecutor(max_workers=self.workers)
+                path = self.out_dir / f"{_slug(s.title)}-{s.id[:8]}.html"
+                with path.open("w", encoding="utf-8") as f:
+                    f.write(self._header(s.title))
+                    for msg, body in zip(messages, self._bodies(messages, pool)):
+                        f.write(self._message_html(msg, body))
+                    f.write("</main></body></html>\n")
+                del messages
+                if not loaded and self.state is not None:
+                    self.state.unload_sessions([s.id])
+                paths.append(path)
+                entries.append((s, path, count))
+                if on_progress:
+                    on_progress(done, len(sessions))
+            if len(sessions) > 1:
+                paths.append(self._write_index(entries))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return paths
+
+    def _bodies(self, messages: List[Message], pool: Optional[Executor]) -> Iterator[str]:
+        contents = [m.content for m in messages]
+        if pool is None:
+            return map(_render_body, contents)
+        # map() yields in submission order, so pages stream out as chunks finish
+        return pool.map(_render_body, contents, chunksize=CHUNK_SIZE)
+
+    def _header(self, title: str) -> str:
+        return (
+            "<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+            f"<title>{html.escape(title)}</title>"
+            f"<link rel=\"stylesheet\" href=\"{STYLESHEET_NAME}\"></head>"
+            f"<body><h1>{html.escape(title)}</h1><main>\n"
+        )
+
+    def _message_html(self, msg: Message, body: str) -> str:
+        images = "".join(
+            f'<img src="{src}" />' for src in (self._copy_image(p) for p in msg.images) if src
+        )
+        return (
+            f'<div class="msg {html.escape(msg.role)}"><time>{html.escape(msg.created_at)}</time>'
+            f"{images}{body}</div>\n"
+        )
+
+    def _copy_image(self, path: str) -> Optional[str]:
+        src = self._images.get(path)
+        if src is not None:
+            return src
+        file = attachments.resolve(path)
+        if file is None:
+            return None
+        try:
+            if is_ref(path):
+                # Store references already name their content
+                digest = path.split(":", 1)[1][:16]
+            else:
+                with open(file, "rb") as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()[:16]
+            name = digest + (file.suffix.lower() or ".png")
+            self.images_dir.mkdir(parents=True, exist_ok=True)
+            target = self.images_dir / name
+            if not target.exists():
+                shutil.copyfile(file, target)
+        except OSError:
+            return None
+        src = self._images[path] = f"images/{name}"
+        return src
+
+    def _write_index(self, entries: List[Tuple[ChatSession, Path, int]]) -> Path:
+        index = self.out_dir / "index.html"
+        with index.open("w", encoding="utf-8") as f:
+            f.write(self._header("PyTalk export"))
+            f.write("<ul>\n")
+            for s, p, count in entries:
+                f.write(f'<li><a href="{html.escape(p.name)}">{html.escape(s.title)}</a> '
+                        f"({count} messages)</li>\n")
+            f.write("</ul></main></body></html>\n")
+        return index
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+STORE_BYTES = 512 * 1024 * 1024
+# Images younger than this are never collected: they may be generated but not
+# yet attached to a message
+GC_GRACE_S = 3600
+
+
+class ImageStore:
+    # Generated images live at <dir>/<sha256>.png, where the hash covers the
+    # prompt, model, generation config and variant number. The same request
+    # therefore maps to the same file in every run and is served from disk.
+    def __init__(self, directory: Path, max_bytes: int = STORE_BYTES) -> None:
+        self.dir = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(prompt: str, model_id: str, config: Optional[Dict[str, Any]] = None, variant: int = 0) -> str:
+        blob = json.dumps(
+            {"prompt": prompt, "model": model_id, "config": config or {}, "variant": variant},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def stats(self) -> Dict[str, int]:
+        sizes = [p.stat().st_size for p in self.dir.glob("*.png")] if self.dir.is_dir() else []
+        return {"files": len(sizes), "disk_bytes": sum(sizes), "bytes": 0}
+
+    def path_for(self, key: str) -> Path:
+        return self.dir / f"{key}.png"
+
+    def get(self, key: str) -> Optional[Path]:
+        p = self.path_for(key)
+        try:
+            # A hit counts as use, so collection drops unused images first
+            os.utime(p)
+        except OSError:
+            return None
+        return p
+
+    def put(self, key: str, data: bytes) -> Path:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        p = self.path_for(key)
+        tmp = p.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, p)
+        return p
+
+    def generate(
+        self,
+        generate: Callable[..., Optional[bytes]],
+        prompt: str,
+        model_id: str,
+        variants: int = 1,
+        config: Optional[Dict[str, Any]] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> List[Path]:
+        # `generate` is GeminiClient.generate_image. Cached variants come back
+        # at once; the rest are requested concurrently and reported one by one
+        # as they finish. Failed variants are left out of the result.
+        keys = [self.key(prompt, model_id, config, v) for v in range(variants)]
+        paths: Dict[int, Path] = {}
+        missing = []
+        for v, key in enumerate(keys):
+            p = self.get(key)
+            if p is not None:
+                paths[v] = p
+            else:
+                missing.append(v)
+        done = len(paths)
+        if on_progress:
+            on_progress(done, variants)
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing), thread_name_prefix="pytalk-image") as pool:
+                futures = {
+                    pool.submit(generate, prompt=prompt, model_id=model_id, config=config): v for v in missing
+                }
+                for future in as_completed(futures):
+                    v = futures[future]
+                    try:
+                        data = future.result()
+                    except Exception:
+                        data = None
+                    if data:
+                        paths[v] = self.put(keys[v], data)
+                    done += 1
+                    if on_progress:
+                        on_progress(done, variants)
+        return [paths[v] for v in sorted(paths)]
+
+    def collect_garbage(self, referenced: Iterable[str], now: Optional[float] = None) -> int:
+        # Deletes images no message refers to, oldest first, until the store
+        # fits in max_bytes. Orphans below the budget stay as a prompt cache.
+        # Returns the number of bytes freed.
+        if not self.dir.is_dir():
+            return 0
+        now = time.time() if now is None else now
+        keep = {os.path.normcase(os.path.abspath(p)) for p in referenced}
+        files = []
+        total = 0
+        for p in self.dir.glob("*.png"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            total += st.st_size
+            if os.path.normcase(os.path.abspath(p)) not in keep and now - st.st_mtime > GC_GRACE_S:
+                files.append((st.st_mtime, st.st_size, p))
+        freed = 0
+        for _mtime, size, p in sorted(files):
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            freed += size
+        return freed
@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.core.json_stream import JsonStream
+from app.core.state import SESSIONS_KEY, AppState, ChatSession, Message, format_ts, parse_ts
+
+# Sessions and messages per transaction; each commit is also a resume point
+BATCH_SESSIONS = 500
+BATCH_MESSAGES = 50_000
+# Top-level keys holding the conversation array in object-shaped exports
+STREAM_KEYS = (SESSIONS_KEY, "conversations", "chats", "sessions")
+
+_ROLES = {
+    "user": "user",
+    "human": "user",
+    "assistant": "assistant",
+    "model": "assistant",
+    "bot": "assistant",
+    "system": "system",
+}
+_NAMESPACE = uuid.UUID("6f1c3c2e-58c5-4c40-9a51-6d1f1f4b7a10")
+
+
+class ImportProgress(NamedTuple):
+    conversations: int
+    messages: int
+    skipped: int
+    bytes_read: int
+    total_bytes: int
+
+
+class ImportResult(NamedTuple):
+    # Counts for this run; progress and checkpoints count the whole file
+    sessions: int
+    messages: int
+    skipped: int  # conversations already present, empty or unreadable
+    resumed_from: int
+    truncated: bool
+
+
+def _timestamp(value: Any) -> Optional[int]:
+    # Epoch seconds (ChatGPT), epoch milliseconds or ISO 8601 strings
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e11 else value
+        return int(round(seconds * 1_000_000))
+    if isinstance(value, str):
+        return parse_ts(value)
+    return None
+
+
+def _text(content: Any) -> str:
+    # Plain strings, lists of strings/parts, or {"parts": [...]} / {"text": ...}
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(filter(None, (_text(p) for p in content)))
+    if isinstance(content, dict):
+        if "parts" in content:
+            return _text(content["parts"])
+        text = content.get("text")
+        return text if isinstance(text, str) else ""
+    return ""
+
+
+def _chatgpt_messages(conv: Dict[str, Any]) -> List[Message]:
+    # The export is a tree of edits; the visible thread runs from
+    # current_node up through the parents
+    mapping: Dict[str, Any] = conv.get("mapping") or {}
+    chain: List[Dict[str, Any]] = []
+    node_id = conv.get("current_node")
+    seen = set()
+    while node_id and node_id in mapping and node_id not in seen:
+        seen.add(node_id)
+        node = mapping[node_id]
+        chain.append(node)
+        node_id = node.get("parent")
+    if not chain:
+        chain = sorted(mapping.values(), key=lambda n: ((n.get("message") or {}).get("create_time") or 0))
+    else:
+        chain.reverse()
+    messages: List[Message] = []
+    for node in chain:
+        msg = node.get("message") or {}
+        role = _ROLES.get(((msg.get("author") or {}).get("role") or "").lower())
+        if role is None or (msg.get("metadata") or {}).get("is_visually_hidden_from_conversation"):
+            continue
+        text = _text((msg.get("content") or {}).get("parts") or [])
+        if not text.strip():
+            continue
+        messages.append(Message(role=role, content=text, created_at=_timestamp(msg.get("create_time"))))
+    return messages
+
+
+def _generic_messages(conv: Dict[str, Any]) -> List[Message]:
+    messages: List[Message] = []
+    for m in conv.get("messages") or conv.get("chat_messages") or []:
+        if not isinstance(m, dict):
+            continue
+        role = _ROLES.get(str(m.get("role") or m.get("sender") or m.get("author") or "").lower())
+        text = _text(m.get("content") if "content" in m else m.get("text"))
+        if role is None or not text.strip():
+            continue
+        created = m.get("created_at", m.get("timestamp", m.get("create_time")))
+        ts = _timestamp(created)
+        images = [i for i in m.get("images") or [] if isinstance(i, str)]
+        # Unparseable timestamp strings are kept verbatim, as Message does
+        messages.append(Message(role=role, content=text, images=images,
+                                created_at=ts if ts is not None or not isinstance(created, str) else created))
+    return messages
+
+
+def to_session(conv: Any, model_id: str, fallback_key: str) -> Optional[ChatSession]:
+    # One exported conversation, in ChatGPT's or a flat {title, messages}
+    # shape (PyTalk's own payload included), as a session with a stable id
+    if not isinstance(conv, dict):
+        return None
+    messages = _chatgpt_messages(conv) if "mapping" in conv else _generic_messages(conv)
+    if not messages:
+        return None
+    source_id = conv.get("id") or conv.get("conversation_id") or conv.get("uuid")
+    try:
+        # UUIDs (PyTalk's own and ChatGPT's) are kept as they are
+        sid = str(uuid.UUID(str(source_id)))
+    except ValueError:
+        sid = str(uuid.uuid5(_NAMESPACE, str(source_id) if source_id else fallback_key))
+    created = _timestamp(conv.get("created_at", conv.get("create_time")))
+    updated = _timestamp(conv.get("updated_at", conv.get("update_time")))
+    first = messages[0].created_ts
+    last = messages[-1].created_ts
+    if created is None:
+        created = first if isinstance(first, int) else None
+    if updated is None:
+        updated = last if isinstance(last, int) else created
+    title = conv.get("title") or conv.get("name") or messages[0].content.strip().splitlines()[0][:60]
+    return ChatSession(
+        id=sid,
+        title=str(title) or "Imported Chat",
+        model_id=conv.get("model_id") or model_id,
+        messages=messages,
+        created_at=format_ts(created) if created is not None else None,
+        updated_at=format_ts(updated) if updated is not None else None,
+    )
+
+
+class _CountingReader(io.RawIOBase):
+    # Byte position of the underlying file for progress, without tell()
+    # on the text layer (which is unusable while it buffers ahead)
+    def __init__(self, raw: IO[bytes]) -> None:
+        self._raw = raw
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        n = self._raw.readinto(b)
+        self.position += n or 0
+        return n
+
+    def close(self) -> None:
+        self._raw.close()
+        super().close()
+
+
+class BulkImporter:
+    # Streams an export file conversation by conversation (JsonStream, or one
+    # JSON object per line for .jsonl) and adds sessions to AppState in
+    # transactions of up to BATCH_SESSIONS sessions / BATCH_MESSAGES messages,
+    # each committed with a single save(). After each commit the imported
+    # histories are unloaded and a checkpoint under <storage>/imports/ records
+    # how far the file got, so an interrupted import resumes there. Session
+    # ids derive from the source conversation ids, so re-importing a file (or
+    # a newer export of the same account) skips what is already present.
+    def __init__(
+        self,
+        state: AppState,
+        batch_sessions: int = BATCH_SESSIONS,
+        batch_messages: int = BATCH_MESSAGES,
+    ) -> None:
+        self.state = state
+        self.batch_sessions = batch_sessions
+        self.batch_messages = batch_messages
+        self.checkpoint_dir = state.storage_dir / "imports"
+
+    def _checkpoint_path(self, source: Path) -> Path:
+        st = source.stat()
+        key = hashlib.sha1(f"{source.resolve()}\0{st.st_size}\0{st.st_mtime_ns}".encode("utf-8")).hexdigest()[:16]
+        return self.checkpoint_dir / f"{key}.json"
+
+    def _read_checkpoint(self, path: Path) -> Dict[str, Any]:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_checkpoint(self, path: Path, data: Dict[str, Any]) -> None:
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        tmp.replace(path)
+
+    def _conversations(self, f: IO[str], source: Path) -> Tuple[Iterator[Any], Callable[[], bool]]:
+        if source.suffix.lower() == ".jsonl":
+            def lines() -> Iterator[Any]:
+                for line in f:
+                    if line.strip():
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            yield None
+            return lines(), lambda: False
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        stream = JsonStream(_Prepend(head, f), stream_keys=STREAM_KEYS)
+        if head == "[":
+            return stream.elements(), lambda: stream.truncated
+        items = (value for key, value in stream.items() if key in STREAM_KEYS)
+        return items, lambda: stream.truncated
+
+    def run(
+        self,
+        source: Path,
+        on_progress: Optional[Callable[[ImportProgress], None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> ImportResult:
+        checkpoint = self._checkpoint_path(source)
+        saved = self._read_checkpoint(checkpoint)
+        resume_at = int(saved.get("done", 0))
+        if saved.get("finished"):
+            return ImportResult(0, 0, 0, resume_at, False)
+        before = (int(saved.get("sessions", 0)), int(saved.get("messages", 0)), int(saved.get("skipped", 0)))
+        sessions, messages, skipped = before
+        total_bytes = source.stat().st_size
+        existing = {s.id for s in self.state.sessions}
+        model_id = self.state.settings.current_model
+        key = checkpoint.stem
+
+        counter = _CountingReader(source.open("rb"))
+        f = io.TextIOWrapper(io.BufferedReader(counter, 1 << 20), encoding="utf-8")
+        batch: List[ChatSession] = []
+        batch_messages = 0
+        done = 0
+        last_report = 0.0
+        truncated = False
+
+        def commit() -> None:
+            nonlocal batch, batch_messages
+            if batch:
+                with self.state.transaction():
+                    self.state.add_sessions(batch)
+                self.state.unload_sessions(s.id for s in batch)
+            self._write_checkpoint(checkpoint, {
+                "source": str(source),
+                "done": done,
+                "sessions": sessions,
+                "messages": messages,
+                "skipped": skipped,
+                "finished": False,
+            })
+            batch = []
+            batch_messages = 0
+
+        try:
+            conversations, is_truncated = self._conversations(f, source)
+            for conv in conversations:
+                if cancel is not None and cancel.is_set():
+                    break
+                done += 1
+                if done <= resume_at:
+                    continue
+                session = to_session(conv, model_id, f"{key}:{done}")
+                if session is None or session.id in existing:
+                    skipped += 1
+                else:
+                    existing.add(session.id)
+                    batch.append(session)
+                    sessions += 1
+                    messages += len(session.messages)
+                    batch_messages += len(session.messages)
+                if len(batch) >= self.batch_sessions or batch_messages >= self.batch_messages:
+                    commit()
+                now = time.monotonic()
+                if on_progress and now - last_report >= 0.1:
+                    last_report = now
+                    on_progress(ImportProgress(done, messages, skipped, counter.position, total_bytes))
+            truncated = is_truncated()
+            finished = cancel is None or not cancel.is_set()
+            commit()
+            if finished:
+                self._write_checkpoint(checkpoint, {
+                    "source": str(source),
+                    "done": done,
+                    "sessions": sessions,
+                    "messages": messages,
+                    "skipped": skipped,
+                    "finished": True,
+                })
+        finally:
+            f.close()
+        if on_progress:
+            on_progress(ImportProgress(done, messages, skipped, counter.position, total_bytes))
+        return ImportResult(sessions - before[0], messages - before[1], skipped - before[2], resume_at, truncated)
+
+
+class _Prepend(io.TextIOBase):
+    # Puts the character consumed while sniffing the format back in front
+    def __init__(self, head: str, f: IO[str]) -> None:
+        self._head = head
+        self._f = f
+
+    def read(self, size: Optional[int] = -1) -> str:
+        head, self._head = self._head, ""
+        if size is None or size < 0:
+            return head + self._f.read()
+        return head + self._f.read(max(0, size - len(head)))
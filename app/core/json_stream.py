@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import IO, Any, Collection, Iterator, Tuple
+
+_CHUNK_SIZE = 1 << 16
+_WS = re.compile(r"\s*")
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.S)
+_SCALAR = re.compile(r"[^,:\]}\s]+")
+_DECODER = json.JSONDecoder()
+
+
+class _Truncated(Exception):
+    pass
+
+
+class _Scanner:
+    # Holds at most one record plus the read-ahead in memory. Records are
+    # decoded straight from the buffer; only when that fails is the record's
+    # extent found by bracket matching, so a malformed record can be skipped
+    # without losing the position of the next one.
+
+    def __init__(self, f: IO[str]) -> None:
+        self._f = f
+        self._buf = ""
+        self._pos = 0
+
+    def _fill(self) -> bool:
+        # Grow geometrically so re-decoding a record that spans reads stays linear
+        chunk = self._f.read(max(_CHUNK_SIZE, len(self._buf) - self._pos))
+        if not chunk:
+            return False
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        self._buf += chunk
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._pos = _WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"expected {ch!r} at offset {self._pos}")
+        self._pos += 1
+
+    def read_value(self) -> Any:
+        if not self.peek():
+            raise _Truncated()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                incomplete = e.pos >= len(self._buf) or e.msg.startswith("Unterminated")
+                if incomplete and self._fill():
+                    continue
+                break
+            # A value ending exactly at the buffer end may continue (e.g. a number)
+            if end < len(self._buf) or not self._fill():
+                self._pos = end
+                return value
+        return json.loads(self.raw_value())
+
+    def raw_value(self) -> str:
+        first = self.peek()
+        if not first:
+            raise _Truncated()
+        start = self._pos
+        if first == '"':
+            end = self._string_end(start)
+        elif first in "[{":
+            end = self._container_end(start)
+        else:
+            end = self._scalar_end(start)
+        # _fill() may have compacted the buffer; offsets are kept relative to it
+        start = self._pos
+        self._pos = end
+        return self._buf[start:end]
+
+    def _string_end(self, offset: int) -> int:
+        while True:
+            m = _STRING.match(self._buf, offset)
+            if m is not None:
+                return m.end()
+            offset -= self._pos
+            if not self._fill():
+                raise _Truncated()
+            offset += self._pos
+
+    def _scalar_end(self, offset: int) -> int:
+        while True:
+            m = _SCALAR.match(self._buf, offset)
+            end = m.end() if m else offset
+            if end < len(self._buf):
+                return end
+            offset -= self._pos
+            if not self._fill():
+                return len(self._buf)
+            offset += self._pos
+
+    def _container_end(self, offset: int) -> int:
+        depth = 0
+        i = offset
+        while True:
+            m = _STRUCTURAL.search(self._buf, i)
+            if m is None:
+                rel = i - self._pos
+                if not self._fill():
+                    raise _Truncated()
+                i = rel + self._pos
+                continue
+            ch = m.group()
+            if ch == '"':
+                i = self._string_end(m.start())
+                continue
+            i = m.end()
+            if ch in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return i
+
+
+class JsonStream:
+    # Incremental reader for a top-level JSON object or array. Arrays found
+    # under `stream_keys` (or the top-level array itself) are yielded element by
+    # element; every other value is decoded whole. Values that fail to decode
+    # are counted in `skipped`, and a truncated or structurally broken file ends
+    # iteration early with `truncated` set instead of raising.
+
+    def __init__(self, f: IO[str], stream_keys: Collection[str] = ()) -> None:
+        self._scanner = _Scanner(f)
+        self._stream_keys = stream_keys
+        self.skipped = 0
+        self.truncated = False
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        sc = self._scanner
+        try:
+            sc.expect("{")
+            if sc.peek() == "}":
+                return
+            while True:
+                key = sc.read_value()
+                sc.expect(":")
+                if key in self._stream_keys and sc.peek() == "[":
+                    for element in self._elements():
+                        yield key, element
+                else:
+                    try:
+                        value = sc.read_value()
+                    except json.JSONDecodeError:
+                        self.skipped += 1
+                    else:
+                        yield key, value
+                if sc.peek() != ",":
+                    sc.expect("}")
+                    return
+                sc.expect(",")
+        except (_Truncated, ValueError):
+            self.truncated = True
+
+    def elements(self) -> Iterator[Any]:
+        try:
+            yield from self._elements()
+        except (_Truncated, ValueError):
+            self.truncated = True
+
+    def _elements(self) -> Iterator[Any]:
+        sc = self._scanner
+        sc.expect("[")
+        if sc.peek() == "]":
+            sc.expect("]")
+            return
+        while True:
+            try:
+                value = sc.read_value()
+            except json.JSONDecodeError:
+                self.skipped += 1
+            else:
+                yield value
+            if sc.peek() != ",":
+                sc.expect("]")
+                return
+            sc.expect(",")
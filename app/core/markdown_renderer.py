@@ -2,7 +2,12 @@ from __future__ import annotations
 
 import base64
 import html
-from typing import List
+import itertools
+import queue
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
 
 from markdown_it import MarkdownIt
 from pygments import highlight
@@ -23,33 +28,129 @@ def _highlight_code(code: str, lang: str | None) -> str:
         return f"<pre><code>{code}</code></pre>"
 
 
-def render_markdown(md_text: str) -> str:
-    md = MarkdownIt("commonmark", {"html": False, "linkify": True, "typographer": True})
+_CACHE_LIMIT = 512
+_highlighted: "OrderedDict[Tuple[str, Optional[str]], str]" = OrderedDict()
+_highlighted_lock = threading.Lock()
 
-    tokens = md.parse(md_text)
-    html_parts: List[str] = []
-    i = 0
-    while i < len(tokens):
-        tok = tokens[i]
-        if tok.type == "fence" and tok.tag == "code":
-            info = tok.info or ""
-            code = tok.content
-            lang = info.strip().split()[0] if info else None
-            code_html = _highlight_code(code, lang)
-            encoded = base64.b64encode(code.encode("utf-8")).decode("ascii")
-            html_parts.append(f"""
-            <div class="codeblock">
-              <a class="copy-btn" href="copy:{encoded}">Copy</a>
-              {code_html}
-            </div>
-            """)
-        else:
-            html_parts.append(tok.content if tok.type == "inline" else tok.markup or "")
-        i += 1
 
-    css = HtmlFormatter(style="monokai").get_style_defs('.highlight')
-    base_css = f"""
-    <style>
+def _cached_highlight(code: str, lang: Optional[str]) -> Optional[str]:
+    with _highlighted_lock:
+        html_ = _highlighted.get((code, lang))
+        if html_ is not None:
+            _highlighted.move_to_end((code, lang))
+        return html_
+
+
+def has_highlight(code: str, lang: Optional[str]) -> bool:
+    with _highlighted_lock:
+        return (code, lang) in _highlighted
+
+
+def _store_highlight(code: str, lang: Optional[str], html_: str) -> None:
+    with _highlighted_lock:
+        _highlighted[(code, lang)] = html_
+        if len(_highlighted) > _CACHE_LIMIT:
+            _highlighted.popitem(last=False)
+
+
+def highlight_cache_stats() -> Dict[str, int]:
+    with _highlighted_lock:
+        entries = list(_highlighted.items())
+    return {
+        "entries": len(entries),
+        "bytes": sum(sys.getsizeof(code) + sys.getsizeof(html_) for (code, _lang), html_ in entries),
+    }
+
+
+def _plain_code(code: str) -> str:
+    return f'<div class="highlight"><pre>{html.escape(code)}</pre></div>'
+
+
+class HighlightQueue:
+    # Single background worker. Jobs are ordered by (generation, distance):
+    # nearest the viewport first within the current generation. A view starts
+    # a new generation when it switches session, which drops everything still
+    # queued, so the queue never outgrows what is on screen. A block is queued
+    # once however often it is submitted: later submissions only add their
+    # callback (one per token) or move it forward. Callbacks fire on the
+    # worker thread once the block's highlighted HTML is cached.
+    def __init__(self) -> None:
+        self._queue: "queue.PriorityQueue[Tuple[Tuple[int, int], int, Tuple[str, Optional[str]]]]" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        # (code, lang) -> (priority it is queued at, callbacks by token)
+        self._jobs: Dict[Tuple[str, Optional[str]], Tuple[Tuple[int, int], Dict[Hashable, Callable[[], None]]]] = {}
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def new_generation(self) -> int:
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._jobs.clear()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        return generation
+
+    def submit(
+        self,
+        code: str,
+        lang: Optional[str],
+        distance: int,
+        callback: Callable[[], None],
+        token: Optional[Hashable] = None,
+    ) -> None:
+        key = (code, lang)
+        priority = (-self._generation, distance)
+        with self._lock:
+            job = self._jobs.get(key)
+            callbacks = job[1] if job is not None else {}
+            callbacks[callback if token is None else token] = callback
+            if job is None or priority < job[0]:
+                self._jobs[key] = (priority, callbacks)
+                self._queue.put((priority, next(self._seq), key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pytalk-highlight", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            priority, _, key = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(key)
+            # Dropped with its generation, or re-queued at a better priority
+            if job is None or job[0] != priority:
+                continue
+            code, lang = key
+            if _cached_highlight(code, lang) is None:
+                _store_highlight(code, lang, _highlight_code(code, lang))
+            with self._lock:
+                job = self._jobs.pop(key, None)
+            for callback in (job[1].values() if job is not None else ()):
+                try:
+                    callback()
+                except Exception:
+                    pass
+
+
+highlighter = HighlightQueue()
+
+
+_STYLESHEET: Optional[str] = None
+
+
+def stylesheet() -> str:
+    global _STYLESHEET
+    if _STYLESHEET is None:
+        css = HtmlFormatter(style="monokai").get_style_defs('.highlight')
+        _STYLESHEET = f"""
       body {{
         background-color: #0b1020;
         color: #d1d5db;
@@ -85,9 +186,54 @@ def render_markdown(md_text: str) -> str:
         overflow-x: auto;
       }}
       {css}
-    </style>
     """
-    body = "".join(html_parts)
-    return f"<!DOCTYPE html><html><head>{base_css}</head><body>{body}</body></html>"
+    return _STYLESHEET
+
+
+def render_markdown_body(
+    md_text: str,
+    highlight: bool = True,
+    pending: Optional[List[Tuple[str, Optional[str]]]] = None,
+) -> str:
+    # highlight=False renders code blocks that aren't cached yet as plain
+    # escaped <pre> and appends their (code, lang) to `pending`.
+    md = MarkdownIt("commonmark", {"html": False, "linkify": True, "typographer": True})
+
+    tokens = md.parse(md_text)
+    html_parts: List[str] = []
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok.type == "fence" and tok.tag == "code":
+            info = tok.info or ""
+            code = tok.content
+            lang = info.strip().split()[0] if info else None
+            code_html = _cached_highlight(code, lang)
+            if code_html is None:
+                if highlight:
+                    code_html = _highlight_code(code, lang)
+                    _store_highlight(code, lang, code_html)
+                else:
+                    code_html = _plain_code(code)
+                    if pending is not None:
+                        pending.append((code, lang))
+            encoded = base64.b64encode(code.encode("utf-8")).decode("ascii")
+            html_parts.append(f"""
+            <div class="codeblock">
+              <a class="copy-btn" href="copy:{encoded}">Copy</a>
+              {code_html}
+            </div>
+            """)
+        else:
+            html_parts.append(tok.content if tok.type == "inline" else tok.markup or "")
+        i += 1
+    return "".join(html_parts)
 
 
+def render_markdown(
+    md_text: str,
+    highlight: bool = True,
+    pending: Optional[List[Tuple[str, Optional[str]]]] = None,
+) -> str:
+    body = render_markdown_body(md_text, highlight, pending)
+    return f"<!DOCTYPE html><html><head><style>{stylesheet()}</style></head><body>{body}</body></html>"
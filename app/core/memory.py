@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.state import AppState, Message
+
+DIM = 256
+# Characters of a message that are embedded and kept as its snippet
+EMBED_CHARS = 4000
+SNIPPET_CHARS = 600
+MIN_SCORE = 0.3
+
+_WORD = re.compile(r"\w+")
+
+
+def embed(text: str, dim: int = DIM) -> np.ndarray:
+    # Hashing-trick bag of words plus character trigrams, L2-normalised.
+    # Stable across runs (crc32) and needs no model or network.
+    feats: List[str] = []
+    weights: List[float] = []
+    for w in _WORD.findall(text[:EMBED_CHARS].lower()):
+        # Whole words count double against their trigrams
+        feats.append("w:" + w)
+        weights.append(2.0)
+        padded = f" {w} "
+        feats.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        weights.extend([1.0] * (len(padded) - 2))
+    vec = np.zeros(dim, dtype=np.float32)
+    if not feats:
+        return vec
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in feats), dtype=np.uint32, count=len(feats))
+    signed = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32) * np.asarray(weights, dtype=np.float32)
+    np.add.at(vec, (hashes % dim).astype(np.intp), signed)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+class Hit(NamedTuple):
+    session_id: str
+    index: int
+    score: float
+    text: str
+
+
+class SemanticMemory:
+    # Embeddings of every chat message in <dir>/vectors.f32, a float32 matrix
+    # memory-mapped from disk and grown by doubling; row metadata and snippets
+    # go to the append-only <dir>/entries.jsonl, of which only byte offsets
+    # stay in memory. A query is one matrix-vector product over all rows.
+    #
+    # Messages arrive through the "message-appended" event. Each session is
+    # indexed as a contiguous prefix, so an event past the prefix (a session
+    # not backfilled yet) is left to backfill() instead of leaving a gap.
+    # <dir>/indexed.json keeps the updated_at of each session as of its last
+    # complete pass, so backfill() does not reread unchanged sessions.
+    #
+    # A row's vector is written before its entry line, and an entry line only
+    # counts once it ends in a newline, so after a crash the entries never
+    # point past the vectors; _load() cuts off whatever was left half written.
+    def __init__(self, directory: Path, dim: int = DIM) -> None:
+        self.dir = directory
+        self.dim = dim
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.dir / "vectors.f32"
+        self._entries_path = self.dir / "entries.jsonl"
+        self._marks_path = self.dir / "indexed.json"
+        self._lock = threading.Lock()
+        self._n = 0
+        self._codes = np.zeros(0, dtype=np.int32)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._offsets = np.zeros(0, dtype=np.int64)
+        self._session_codes: Dict[str, int] = {}
+        self._session_ids: List[str] = []
+        self._indexed: Dict[str, int] = {}
+        self._marks: Dict[str, str] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._load()
+
+    def __len__(self) -> int:
+        return self._n
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            arrays = self._codes.nbytes + self._indices.nbytes + self._offsets.nbytes
+            mapped = self._vectors.nbytes if self._vectors is not None else 0
+        # The mapped matrix is paged in by the OS and only counts once searched
+        return {"rows": self._n, "bytes": arrays, "mapped_bytes": mapped}
+
+    def attach(self, state: AppState) -> None:
+        state.subscribe("message-appended", lambda sid, i: self._on_appended(state, sid, i))
+        state.subscribe("session-deleted", self.forget)
+
+    # Storage
+    def _load(self) -> None:
+        try:
+            marks = json.loads(self._marks_path.read_text(encoding="utf-8"))
+            if isinstance(marks, dict):
+                self._marks = marks
+        except (OSError, ValueError):
+            pass
+        rows: List[Tuple[int, int, int]] = []
+        forgets: List[Tuple[int, bytes]] = []
+        offset = 0
+        end: Optional[int] = None
+        if self._entries_path.exists():
+            with self._entries_path.open("rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("torn line")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash
+                        end = offset
+                        break
+                    if entry[0] == "-":
+                        code = self._session_codes.get(entry[1])
+                        rows = [(c if c != code else -1, i, o) for c, i, o in rows]
+                        forgets.append((offset, line))
+                    else:
+                        rows.append((self._code(entry[0]), entry[1], offset))
+                    offset += len(line)
+        capacity = max(1024, len(rows))
+        if self._vectors_path.exists():
+            capacity = max(capacity, self._vectors_path.stat().st_size // (4 * self.dim))
+        self._open(capacity)
+        # Only rows whose vector reached the file count. Empty embeddings are
+        # never stored and forgotten rows are zeroed, so a zero row at the end
+        # is one whose vector was lost or no longer matters.
+        n = min(len(rows), capacity)
+        while n and not self._vectors[n - 1].any():
+            n -= 1
+        if n < len(rows):
+            end = rows[n][2]
+            self._drop_marks(rows[n:])
+        if end is not None:
+            self._truncate_entries(end, [line for at, line in forgets if at >= end])
+        self._entries = self._entries_path.open("ab")
+        self._n = n
+        self._codes = np.full(capacity, -1, dtype=np.int32)
+        self._indices = np.zeros(capacity, dtype=np.int32)
+        self._offsets = np.zeros(capacity, dtype=np.int64)
+        if n:
+            codes, indices, offsets = zip(*rows[:n])
+            self._codes[:n] = codes
+            self._indices[:n] = indices
+            self._offsets[:n] = offsets
+        for code, index, _offset in rows[:n]:
+            if code >= 0:
+                sid = self._session_ids[code]
+                self._indexed[sid] = max(self._indexed.get(sid, 0), index + 1)
+
+    def _truncate_entries(self, end: int, keep: List[bytes]) -> None:
+        # Appends would otherwise continue the torn line, and every row after
+        # it would pair with the wrong vector. Forget records past the cut
+        # are written again so those sessions stay forgotten.
+        with self._entries_path.open("r+b") as f:
+            f.truncate(end)
+            f.seek(end)
+            f.writelines(keep)
+
+    def _drop_marks(self, rows: List[Tuple[int, int, int]]) -> None:
+        dropped = {self._session_ids[c] for c, _i, _o in rows if c >= 0}
+        if any(self._marks.pop(sid, None) is not None for sid in dropped):
+            self._save_marks()
+
+    def _save_marks(self) -> None:
+        tmp = self._marks_path.with_name(self._marks_path.name + ".tmp")
+        tmp.write_text(json.dumps(self._marks), encoding="utf-8")
+        os.replace(tmp, self._marks_path)
+
+    def _open(self, capacity: int) -> None:
+        if self._vectors is not None:
+            self._vectors.flush()
+        size = capacity * self.dim * 4
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _grow(self) -> None:
+        capacity = len(self._codes) * 2
+        self._open(capacity)
+        self._codes = np.concatenate((self._codes, np.full(capacity - len(self._codes), -1, dtype=np.int32)))
+        self._indices = np.concatenate((self._indices, np.zeros(capacity - len(self._indices), dtype=np.int32)))
+        self._offsets = np.concatenate((self._offsets, np.zeros(capacity - len(self._offsets), dtype=np.int64)))
+
+    def _code(self, session_id: str) -> int:
+        code = self._session_codes.get(session_id)
+        if code is None:
+            code = self._session_codes[session_id] = len(self._session_ids)
+            self._session_ids.append(session_id)
+        return code
+
+    # Indexing
+    def add(self, session_id: str, index: int, message: Message) -> bool:
+        text = message.content.strip()
+        vec = embed(text, self.dim)
+        with self._lock:
+            expected = self._indexed.get(session_id, 0)
+            if index != expected:
+                return False
+            self._indexed[session_id] = index + 1
+            # A zero vector never scores, and _load() relies on stored rows
+            # being non-zero
+            if not vec.any():
+                return True
+            if self._n == len(self._codes):
+                self._grow()
+            self._vectors[self._n] = vec
+            line = json.dumps([session_id, index, text[:SNIPPET_CHARS]], ensure_ascii=False) + "\n"
+            offset = self._entries.tell()
+            self._entries.write(line.encode("utf-8"))
+            self._entries.flush()
+            self._codes[self._n] = self._code(session_id)
+            self._indices[self._n] = index
+            self._offsets[self._n] = offset
+            self._n += 1
+        return True
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._indexed.pop(session_id, None)
+            if self._marks.pop(session_id, None) is not None:
+                self._save_marks()
+            code = self._session_codes.get(session_id)
+            if code is None:
+                return
+            rows = np.flatnonzero(self._codes[: self._n] == code)
+            self._codes[rows] = -1
+            self._vectors[rows] = 0.0
+            self._entries.write((json.dumps(["-", session_id]) + "\n").encode("utf-8"))
+            self._entries.flush()
+
+    def _on_appended(self, state: AppState, session_id: str, index: int) -> None:
+        s = state.get_session(session_id)
+        if s is not None and s.is_materialized() and index < len(s.messages):
+            stamp = s.updated_at
+            if self.add(session_id, index, s.messages[index]) and index == len(s.messages) - 1:
+                # Saved with the next backfill() pass
+                with self._lock:
+                    self._marks[session_id] = stamp
+
+    def backfill(self, state: AppState) -> int:
+        # Indexes messages written before memory existed (or while it was off).
+        # Meant for a background thread; yields between sessions.
+        added = 0
+        for s in list(state.sessions):
+            stamp = s.updated_at
+            if self._marks.get(s.id) == stamp:
+                continue
+            start = self._indexed.get(s.id, 0)
+            if s.is_materialized():
+                messages = list(s.messages)
+            else:
+                messages = state._read_session_messages(s.id, archived=s.archived)
+            complete = True
+            for i in range(start, len(messages)):
+                if not self.add(s.id, i, messages[i]):
+                    complete = False
+                    break
+                added += 1
+            if complete:
+                with self._lock:
+                    self._marks[s.id] = stamp
+            time.sleep(0)
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            # Only after the vectors are on disk
+            self._save_marks()
+        return added
+
+    # Retrieval
+    def search(
+        self,
+        query: str,
+        k: int = 4,
+        exclude: Optional[Dict[str, int]] = None,
+        min_score: float = MIN_SCORE,
+    ) -> List[Hit]:
+        # `exclude` maps a session id to the first message index that is
+        # already in the request, so those messages are not retrieved twice
+        q = embed(query, self.dim)
+        if not q.any():
+            return []
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return []
+            scores = self._vectors[:n] @ q
+            codes = self._codes[:n]
+            scores[codes < 0] = -1.0
+            for sid, first in (exclude or {}).items():
+                code = self._session_codes.get(sid)
+                if code is not None:
+                    scores[(codes == code) & (self._indices[:n] >= first)] = -1.0
+            k = min(k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            picked = [(int(r), float(scores[r])) for r in top if scores[r] >= min_score]
+            offsets = [int(self._offsets[r]) for r, _ in picked]
+        hits: List[Hit] = []
+        with self._entries_path.open("rb") as f:
+            for (_row, score), offset in zip(picked, offsets):
+                f.seek(offset)
+                sid, index, text = json.loads(f.readline())
+                hits.append(Hit(sid, index, score, text))
+        return hits
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+
+class RestError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+class RestTransport:
+    # Talks to the Gemini REST API through one httpx.Client shared by every
+    # thread, so TCP/TLS handshakes happen once per pooled connection rather
+    # than once per request. HTTP/2 is used when asked for and h2 is
+    # installed; base_url can point at a local stub server.
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = DEFAULT_BASE_URL,
+        http2: bool = False,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        max_connections: int = 8,
+    ) -> None:
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._client = httpx.Client(
+            base_url=base_url.rstrip("/") + "/",
+            http2=self.http2,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=120.0,
+            ),
+            headers={"x-goog-api-key": api_key},
+        )
+
+    @staticmethod
+    def _body(
+        contents: List[Dict[str, Any]],
+        system_instruction: Optional[str],
+        generation_config: Optional[Dict[str, Any]],
+        cached_content: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"contents": contents}
+        if cached_content:
+            # The system instruction is part of the cache and may not be repeated
+            body["cachedContent"] = cached_content
+        elif system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        if generation_config:
+            body["generationConfig"] = generation_config
+        return body
+
+    @staticmethod
+    def _check(res: httpx.Response) -> None:
+        if res.status_code < 400:
+            return
+        try:
+            message = res.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = res.text[:200] or res.reason_phrase
+        raise RestError(res.status_code, message)
+
+    def generate_content(
+        self,
+        model_id: str,
+        contents: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        cached_content: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        res = self._client.post(
+            f"models/{model_id}:generateContent",
+            json=self._body(contents, system_instruction, generation_config, cached_content),
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+        )
+        self._check(res)
+        return res.json()
+
+    def stream_generate_content(
+        self,
+        model_id: str,
+        contents: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict[str, Any]] = None,
+        cached_content: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        # Server-sent events: one GenerateContentResponse per "data:" line,
+        # yielded as soon as its line has arrived
+        with self._client.stream(
+            "POST",
+            f"models/{model_id}:streamGenerateContent",
+            params={"alt": "sse"},
+            json=self._body(contents, system_instruction, generation_config, cached_content),
+        ) as res:
+            if res.status_code >= 400:
+                res.read()
+                self._check(res)
+            for line in res.iter_lines():
+                if line.startswith("data:"):
+                    payload = line[5:].strip()
+                    if payload:
+                        yield json.loads(payload)
+
+    def create_cached_content(
+        self,
+        model_id: str,
+        contents: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        ttl_s: int = 900,
+    ) -> Dict[str, Any]:
+        # Returns the CachedContent resource ("name", "expireTime", ...)
+        body: Dict[str, Any] = {"model": f"models/{model_id}", "contents": contents, "ttl": f"{ttl_s}s"}
+        if system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        res = self._client.post("cachedContents", json=body)
+        self._check(res)
+        return res.json()
+
+    def delete_cached_content(self, name: str) -> None:
+        res = self._client.delete(name)
+        if res.status_code != 404:
+            self._check(res)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def response_parts(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    candidates = response.get("candidates") or []
+    if not candidates:
+        return []
+    return (candidates[0].get("content") or {}).get("parts") or []
+
+
+def response_text(response: Dict[str, Any]) -> str:
+    return "".join(p.get("text", "") for p in response_parts(response))
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+# Layout (little endian):
+#   header    magic, version, session count, settings block, index table
+#   settings  UTF-8 JSON of the settings keys
+#   records   per session, contiguous: u32 length + one message record
+#   metas     UTF-8 JSON of each session's metadata
+#   index     one fixed-size entry per session, in session order
+# A record is role, content, image refs and the timestamp, which is either
+# the integer microseconds or, for unparseable ones, the original string.
+MAGIC = b"PYTSNAP\x00"
+VERSION = 1
+_HEADER = struct.Struct("<8sHHIQQQ")
+_ENTRY = struct.Struct("<QIIQQ")  # meta offset, meta length, message count, records offset, records length
+_RECORD = struct.Struct("<BqIHH")  # ts kind, ts (or ts string length), content length, role length, images
+_LEN = struct.Struct("<I")
+_TS_INT, _TS_STR = 0, 1
+
+# (role, content, images, created) with created as Message accepts it
+RawMessage = Tuple[str, str, Tuple[str, ...], Union[int, str]]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _encode(message: Any) -> bytes:
+    role = message.role.encode("utf-8")
+    content = message.content.encode("utf-8")
+    ts = message.created_ts
+    if isinstance(ts, str):
+        ts_bytes = ts.encode("utf-8")
+        head = _RECORD.pack(_TS_STR, len(ts_bytes), len(content), len(role), len(message.images))
+    else:
+        ts_bytes = b""
+        head = _RECORD.pack(_TS_INT, ts, len(content), len(role), len(message.images))
+    parts = [head, role, ts_bytes, content]
+    for ref in message.images:
+        raw = ref.encode("utf-8")
+        parts.append(_LEN.pack(len(raw)))
+        parts.append(raw)
+    body = b"".join(parts)
+    return _LEN.pack(len(body)) + body
+
+
+def write_snapshot(
+    path: Path,
+    settings: Dict[str, Any],
+    sessions: Iterable[Tuple[Dict[str, Any], Iterable[Any]]],
+) -> int:
+    # `sessions` yields (metadata, messages) pairs and is consumed one session
+    # at a time, so only one history needs to be in memory. Written to a
+    # temporary file and moved into place. Returns the number of sessions.
+    tmp = path.with_name(path.name + ".tmp")
+    entries: List[Tuple[Dict[str, Any], int, int, int]] = []
+    with tmp.open("wb") as f:
+        f.write(b"\x00" * _HEADER.size)
+        settings_raw = json.dumps(settings, ensure_ascii=False).encode("utf-8")
+        settings_off = f.tell()
+        f.write(settings_raw)
+        for meta, messages in sessions:
+            start = f.tell()
+            count = 0
+            for m in messages:
+                f.write(_encode(m))
+                count += 1
+            entries.append((meta, count, start, f.tell() - start))
+        metas = []
+        for meta, count, start, length in entries:
+            raw = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+            metas.append((f.tell(), len(raw)))
+            f.write(raw)
+        index_off = f.tell()
+        for (meta_off, meta_len), (_meta, count, start, length) in zip(metas, entries):
+            f.write(_ENTRY.pack(meta_off, meta_len, count, start, length))
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, len(entries), settings_off, len(settings_raw), index_off))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(entries)
+
+
+class Snapshot:
+    # Read side, over a read-only mmap. Opening decodes the header, the
+    # settings and the per-session metadata; message records are decoded
+    # only for the session asked for, so only its pages are touched. close()
+    # waits for a decode in progress; decoding after close raises SnapshotError.
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = path.open("rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise SnapshotError(f"{path}: empty snapshot")
+        try:
+            magic, version, _flags, count, settings_off, settings_len, index_off = _HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise SnapshotError(f"{path}: not a v{VERSION} snapshot")
+            if index_off + count * _ENTRY.size > len(self._mm):
+                raise SnapshotError(f"{path}: truncated")
+            self.settings: Dict[str, Any] = json.loads(self._mm[settings_off:settings_off + settings_len])
+            self._entries = [_ENTRY.unpack_from(self._mm, index_off + i * _ENTRY.size) for i in range(count)]
+            self.sessions: List[Dict[str, Any]] = [
+                json.loads(self._mm[off:off + length]) for off, length, _c, _s, _l in self._entries
+            ]
+        except (struct.error, ValueError) as e:
+            self.close()
+            raise SnapshotError(f"{path}: {e}") from e
+        self._positions = {meta.get("id"): i for i, meta in enumerate(self.sessions)}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __contains__(self, session_id: object) -> bool:
+        return session_id in self._positions
+
+    def close(self) -> None:
+        with self._lock:
+            if getattr(self, "_mm", None) is not None and not self._mm.closed:
+                self._mm.close()
+            self._file.close()
+
+    def message_count(self, session_id: str) -> int:
+        return self._entries[self._positions[session_id]][2]
+
+    def messages(self, session_id: str) -> List[RawMessage]:
+        _mo, _ml, count, start, length = self._entries[self._positions[session_id]]
+        out: List[RawMessage] = []
+        with self._lock:
+            mm = self._mm
+            if mm.closed:
+                raise SnapshotError(f"{self.path}: closed")
+            pos, end = start, start + length
+            while pos < end and len(out) < count:
+                (size,) = _LEN.unpack_from(mm, pos)
+                pos += _LEN.size
+                out.append(self._decode(mm, pos))
+                pos += size
+        return out
+
+    @staticmethod
+    def _decode(mm: mmap.mmap, pos: int) -> RawMessage:
+        kind, ts, content_len, role_len, n_images = _RECORD.unpack_from(mm, pos)
+        pos += _RECORD.size
+        role = mm[pos:pos + role_len].decode("utf-8")
+        pos += role_len
+        created: Union[int, str] = ts
+        if kind == _TS_STR:
+            created = mm[pos:pos + ts].decode("utf-8")
+            pos += ts
+        content = mm[pos:pos + content_len].decode("utf-8")
+        pos += content_len
+        images: List[str] = []
+        for _ in range(n_images):
+            (n,) = _LEN.unpack_from(mm, pos)
+            pos += _LEN.size
+            images.append(mm[pos:pos + n].decode("utf-8"))
+            pos += n
+        return role, content, tuple(images), created
+
+
+def open_snapshot(path: Path) -> Optional[Snapshot]:
+    try:
+        return Snapshot(path)
+    except (OSError, SnapshotError):
+        return None
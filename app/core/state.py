@@ -1,33 +1,167 @@
 from __future__ import annotations
 
 import json
+import lzma
+import os
+import re
+import shutil
+import sys
+import threading
+import time
 import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass, asdict, field
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from app.core.diagnostics import deep_size
+from app.core.json_stream import JsonStream
+from app.core.snapshot import Snapshot, SnapshotError, open_snapshot, write_snapshot
+
+
+_EPOCH = datetime(1970, 1, 1)
+# A quoted key can only appear unescaped outside JSON strings, so this cannot
+# match message text.
+_ACTIVE_RE = re.compile(r'(?<!\\)"pytalk-active-session"\s*:\s*"([^"\\]*)"')
+_TAIL_BYTES = 64 * 1024
+_NO_IMAGES: Tuple[str, ...] = ()
 
 
 def iso_now() -> str:
     return datetime.utcnow().isoformat() + "Z"
 
 
-@dataclass
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def format_ts(us: int) -> str:
+    return (_EPOCH + timedelta(microseconds=us)).isoformat() + "Z"
+
+
+def parse_ts(value: str) -> Optional[int]:
+    try:
+        dt = datetime.fromisoformat(value[:-1] if value.endswith("Z") else value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = dt - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
 class Message:
-    role: str  # "user" | "assistant" | "system"
-    content: str
-    images: List[str] = field(default_factory=list)  # file paths
-    created_at: str = field(default_factory=iso_now)
+    # Slotted with interned roles, a shared empty images tuple and integer
+    # timestamps (formatted only for persistence): histories hold 100k+ of these.
+    __slots__ = ("role", "content", "images", "created_ts")
+
+    def __init__(
+        self,
+        role: str,  # "user" | "assistant" | "system"
+        content: str,
+        images: Optional[Iterable[str]] = None,  # attachment refs or file paths
+        created_at: Union[str, int, None] = None,
+    ) -> None:
+        self.role = sys.intern(role)
+        self.content = content
+        self.images: Tuple[str, ...] = tuple(images) if images else _NO_IMAGES
+        if created_at is None:
+            self.created_ts: Union[int, str] = now_us()
+        elif isinstance(created_at, int):
+            self.created_ts = created_at
+        else:
+            # Unparseable timestamps are kept verbatim so they round-trip
+            ts = parse_ts(created_at)
+            self.created_ts = created_at if ts is None else ts
+
+    @property
+    def created_at(self) -> str:
+        ts = self.created_ts
+        return ts if isinstance(ts, str) else format_ts(ts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "images": list(self.images),
+            "created_at": self.created_at,
+        }
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Message):
+            return NotImplemented
+        return (self.role, self.content, self.images, self.created_ts) == (
+            other.role, other.content, other.images, other.created_ts)
+
+    def __repr__(self) -> str:
+        return (f"Message(role={self.role!r}, content={self.content!r}, "
+                f"images={list(self.images)!r}, created_at={self.created_at!r})")
+
+
+_MATERIALIZE_LOCK = threading.Lock()
 
 
-@dataclass
 class ChatSession:
-    id: str
-    title: str
-    model_id: str
-    messages: List[Message] = field(default_factory=list)
-    created_at: str = field(default_factory=iso_now)
-    updated_at: str = field(default_factory=iso_now)
+    # Messages are loaded on first access when a loader is given, so sessions
+    # that are never opened cost only their metadata.
+    __slots__ = ("id", "title", "model_id", "created_at", "updated_at", "archived", "_messages", "_loader")
+
+    def __init__(
+        self,
+        id: str,
+        title: str,
+        model_id: str,
+        messages: Optional[List[Message]] = None,
+        created_at: Optional[str] = None,
+        updated_at: Optional[str] = None,
+        loader: Optional[Callable[[], List[Message]]] = None,
+        archived: bool = False,
+    ) -> None:
+        self.id = id
+        self.title = title
+        self.model_id = model_id
+        self.created_at = created_at or iso_now()
+        self.updated_at = updated_at or iso_now()
+        self.archived = archived
+        self._loader = loader if messages is None else None
+        self._messages = messages if messages is not None or loader else []
+
+    @property
+    def messages(self) -> List[Message]:
+        if self._messages is None:
+            with _MATERIALIZE_LOCK:
+                if self._messages is None:
+                    self._messages = self._loader()
+                    self._loader = None
+        return self._messages
+
+    @messages.setter
+    def messages(self, value: List[Message]) -> None:
+        self._messages = value
+        self._loader = None
+
+    def is_materialized(self) -> bool:
+        return self._messages is not None
+
+    def unload(self, loader: Callable[[], List[Message]]) -> None:
+        self._messages = None
+        self._loader = loader
+
+    def meta(self) -> Dict[str, Any]:
+        meta = {
+            "id": self.id,
+            "title": self.title,
+            "model_id": self.model_id,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.archived:
+            meta["archived"] = True
+        return meta
+
+    def __repr__(self) -> str:
+        return f"ChatSession(id={self.id!r}, title={self.title!r}, model_id={self.model_id!r})"
 
 
 @dataclass
@@ -42,6 +176,12 @@ class Settings:
     sidebar_visible: bool = True
     muted: bool = False
     current_model: str = "gemini-1.5-flash"
+    archive_after_days: int = 7
+    message_view: str = "document"  # "document" | "list"
+    stt_backend: str = "google"  # see app.core.stt_backends.BACKENDS
+    image_variants: int = 1
+    history_window: int = 20  # messages sent per request, 0 = all
+    prefix_cache: bool = True  # cache long system instructions and history with the provider
     models: List[ModelInfo] = field(default_factory=lambda: [
         ModelInfo(name="Gemini 1.5 Flash", model_id="gemini-1.5-flash"),
         ModelInfo(name="Gemini 1.5 Pro", model_id="gemini-1.5-pro"),
@@ -49,77 +189,473 @@ class Settings:
     ])
 
 
+SESSIONS_KEY = "pytalk-sessions"
+INDEX_KEY = "pytalk-session-index"
+# Index key listing the sessions whose messages live in pytalk.snap
+SNAPSHOT_KEY = "pytalk-snapshot-sessions"
+
+
+def _parse_messages(raw: Any) -> List[Message]:
+    # A malformed message is skipped on its own, keeping the rest of its session
+    messages: List[Message] = []
+    for m in raw or []:
+        try:
+            messages.append(Message(**m))
+        except (TypeError, ValueError):
+            pass
+    return messages
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
 class AppState:
+    # On disk: a small index (settings + session metadata) and one file per
+    # session under sessions/. save() rewrites only the sessions marked dirty,
+    # and the index only when its content changed. Sessions idle for longer
+    # than archive_after_days move to lzma files under archive/ and keep only
+    # their metadata in memory. The single-file pytalk.json layout is still
+    # readable and migrated on first load.
+    #
+    # A binary snapshot (pytalk.snap, see app.core.snapshot) can hold any
+    # number of sessions as a read-only tier: the index lists which sessions
+    # it backs, and their messages are decoded from the mmap on open. A
+    # session leaves the tier once it is written as a shard or archived.
     def __init__(self, storage_dir: Path) -> None:
         self.storage_dir = storage_dir
         self.storage_path = storage_dir / "pytalk.json"
+        self.index_path = storage_dir / "pytalk-index.json"
+        self.sessions_dir = storage_dir / "sessions"
+        self.archive_dir = storage_dir / "archive"
+        self.snapshot_path = storage_dir / "pytalk.snap"
         self.sessions: List[ChatSession] = []
         self.settings: Settings = Settings()
         self.active_session_id: Optional[str] = None
+        self._lock = threading.RLock()
+        self._loaded = threading.Event()
+        self._loaded.set()
+        self._save_pending = False
+        self._batch_depth = 0
+        self._migrating = False
+        self._dirty: Set[str] = set()
+        self._deleted: Set[str] = set()
+        self._rehydrated: Set[str] = set()
+        self._index_text: Optional[str] = None
+        # (moved-aside path, error) when the index was unreadable and rebuilt
+        # from the session files at load; shown once the window is up
+        self.index_recovery: Optional[Tuple[str, str]] = None
+        self._snapshot: Optional[Snapshot] = None
+        self._snapshot_ids: Set[str] = set()
+        # Sessions with replies the user has not looked at yet (not persisted)
+        self.unread: Set[str] = set()
+        self._listeners: Dict[str, List[Callable[..., None]]] = {}
 
-    # Persistence schema compatible with the spec keys
-    def to_payload(self) -> Dict[str, Any]:
+    # Events (callbacks may run on a worker thread)
+    def subscribe(self, event: str, callback: Callable[..., None]) -> None:
+        self._listeners.setdefault(event, []).append(callback)
+
+    def _emit(self, event: str, *args: Any) -> None:
+        for cb in list(self._listeners.get(event, ())):
+            cb(*args)
+
+    def _settings_payload(self) -> Dict[str, Any]:
         return {
-            "pytalk-sessions": [
-                {
-                    "id": s.id,
-                    "title": s.title,
-                    "model_id": s.model_id,
-                    "messages": [asdict(m) for m in s.messages],
-                    "created_at": s.created_at,
-                    "updated_at": s.updated_at,
-                } for s in self.sessions
-            ],
             "pytalk-models": [asdict(m) for m in self.settings.models],
             "pytalk-current-model": self.settings.current_model,
             "pytalk-system-instruction": self.settings.system_instruction,
             "pytalk-sidebar-visible": self.settings.sidebar_visible,
             "pytalk-muted": self.settings.muted,
             "pytalk-active-session": self.active_session_id,
+            "pytalk-archive-after-days": self.settings.archive_after_days,
+            "pytalk-message-view": self.settings.message_view,
+            "pytalk-stt-backend": self.settings.stt_backend,
+            "pytalk-image-variants": self.settings.image_variants,
+            "pytalk-history-window": self.settings.history_window,
+            "pytalk-prefix-cache": self.settings.prefix_cache,
         }
 
+    # Single-document schema compatible with the spec keys. Settings come
+    # before sessions so the streaming loader knows the active session early.
+    def to_payload(self) -> Dict[str, Any]:
+        self._loaded.wait()
+        payload = self._settings_payload()
+        payload[SESSIONS_KEY] = [
+            dict(s.meta(), messages=[m.to_dict() for m in s.messages]) for s in self.sessions
+        ]
+        return payload
+
     def from_payload(self, data: Dict[str, Any]) -> None:
+        self.sessions = []
+        self.active_session_id = None
+        for key, value in data.items():
+            if key == SESSIONS_KEY:
+                for raw in value or []:
+                    session = self._session_from_record(raw)
+                    if session is not None:
+                        self.sessions.append(session)
+            else:
+                self._apply_setting(key, value)
+
+    def _session_from_record(self, s: Dict[str, Any], lazy: bool = False) -> Optional[ChatSession]:
+        # A malformed record only drops that session, not the whole history
         try:
-            sessions_raw = data.get("pytalk-sessions", [])
-            self.sessions = []
-            for s in sessions_raw:
-                msgs = [Message(**m) for m in s.get("messages", [])]
-                self.sessions.append(ChatSession(
-                    id=s["id"],
-                    title=s.get("title", "New Chat"),
-                    model_id=s.get("model_id", self.settings.current_model),
-                    messages=msgs,
-                    created_at=s.get("created_at", iso_now()),
-                    updated_at=s.get("updated_at", iso_now()),
-                ))
-            models_raw = data.get("pytalk-models", [])
-            if models_raw:
-                self.settings.models = [ModelInfo(**m) for m in models_raw]
-            self.settings.current_model = data.get("pytalk-current-model", self.settings.current_model)
-            self.settings.system_instruction = data.get("pytalk-system-instruction", self.settings.system_instruction)
-            self.settings.sidebar_visible = bool(data.get("pytalk-sidebar-visible", self.settings.sidebar_visible))
-            self.settings.muted = bool(data.get("pytalk-muted", self.settings.muted))
-            self.active_session_id = data.get("pytalk-active-session", None)
-        except Exception:
-            # Reset on corruption
-            self.sessions = []
-            self.settings = Settings()
-            self.active_session_id = None
+            sid = s["id"]
+            archived = bool(s.get("archived", False))
+            return ChatSession(
+                id=sid,
+                title=s.get("title", "New Chat"),
+                model_id=s.get("model_id", self.settings.current_model),
+                messages=None if lazy else _parse_messages(s.get("messages")),
+                created_at=s.get("created_at"),
+                updated_at=s.get("updated_at"),
+                loader=self._loader_for(sid, archived) if lazy else None,
+                archived=archived and lazy,
+            )
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+    def _apply_setting(self, key: str, value: Any) -> None:
+        try:
+            if key == "pytalk-models":
+                if value:
+                    self.settings.models = [ModelInfo(**m) for m in value]
+            elif key == "pytalk-current-model":
+                self.settings.current_model = value
+            elif key == "pytalk-system-instruction":
+                self.settings.system_instruction = value
+            elif key == "pytalk-sidebar-visible":
+                self.settings.sidebar_visible = bool(value)
+            elif key == "pytalk-muted":
+                self.settings.muted = bool(value)
+            elif key == "pytalk-active-session":
+                self.active_session_id = value
+            elif key == "pytalk-archive-after-days":
+                self.settings.archive_after_days = int(value)
+            elif key == "pytalk-message-view":
+                self.settings.message_view = str(value)
+            elif key == "pytalk-stt-backend":
+                self.settings.stt_backend = str(value)
+            elif key == "pytalk-image-variants":
+                self.settings.image_variants = max(1, int(value))
+            elif key == "pytalk-history-window":
+                self.settings.history_window = max(0, int(value))
+            elif key == "pytalk-prefix-cache":
+                self.settings.prefix_cache = bool(value)
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    def _session_path(self, session_id: str) -> Path:
+        return self.sessions_dir / f"{session_id}.json"
+
+    def _archive_path(self, session_id: str) -> Path:
+        return self.archive_dir / f"{session_id}.json.xz"
+
+    def _loader_for(self, session_id: str, archived: bool) -> Callable[[], List[Message]]:
+        if archived:
+            return lambda: self._read_session_messages(session_id, archived=True)
+        return lambda: self._read_session_messages(session_id)
+
+    def _read_session_messages(self, session_id: str, archived: bool = False) -> List[Message]:
+        # The snapshot is looked up under the lock but decoded outside it. If
+        # save() closes or replaces it meanwhile, the lookup is repeated: the
+        # session is then either in the new snapshot or written as a shard.
+        while True:
+            with self._lock:
+                snap = self._snapshot
+                if snap is None or session_id not in self._snapshot_ids or session_id not in snap:
+                    break
+            try:
+                return [Message(*m) for m in snap.messages(session_id)]
+            except SnapshotError:
+                continue
+        try:
+            if archived:
+                path = self._archive_path(session_id)
+                with lzma.open(path, "rt", encoding="utf-8") as f:
+                    raw = json.load(f).get("messages", [])
+            else:
+                path = self._session_path(session_id)
+                with path.open("r", encoding="utf-8") as f:
+                    raw = json.load(f).get("messages", [])
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, AttributeError, lzma.LZMAError) as e:
+            self._quarantine(session_id, path, e)
+            return []
+        return _parse_messages(raw)
+
+    def _quarantine(self, session_id: str, path: Path, error: Exception) -> None:
+        # An unreadable history is moved aside before the session carries on
+        # empty, so the next save of that session cannot overwrite it. If it
+        # cannot even be moved, the read error is raised and the session
+        # stays unloaded.
+        target = path.with_name(path.name + ".corrupt")
+        try:
+            os.replace(path, target)
+        except OSError:
+            raise error
+        self._emit("session-unreadable", session_id, str(target), str(error))
 
     def load(self) -> None:
-        if self.storage_path.exists():
-            with self.storage_path.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-                self.from_payload(data)
+        if self.index_path.exists():
+            self._load_index()
+        elif self.snapshot_path.exists():
+            self.load_snapshot(self.snapshot_path)
+        elif self.storage_path.exists():
+            # Legacy single file: read it as before, then write it out sharded
+            self._migrating = True
+            self._stream_load()
+            self.save()
         if not self.sessions:
             s = self.create_session(title="New Chat")
             self.active_session_id = s.id
             self.save()
 
+    def _load_index(self) -> None:
+        try:
+            with self.index_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+        except (OSError, ValueError) as e:
+            # Moved aside rather than overwritten by the next save; if that
+            # fails the error is raised and nothing on disk is touched
+            target = self.index_path.with_name(self.index_path.name + ".corrupt")
+            try:
+                os.replace(self.index_path, target)
+            except OSError:
+                raise e
+            self.index_recovery = (str(target), str(e))
+            self._rebuild_index()
+            return
+        self.sessions = []
+        self.active_session_id = None
+        ids = data.get(SNAPSHOT_KEY)
+        if ids:
+            self._snapshot = open_snapshot(self.snapshot_path)
+            if self._snapshot is not None:
+                self._snapshot_ids = {sid for sid in ids if sid in self._snapshot}
+        for key, value in data.items():
+            if key == INDEX_KEY:
+                for raw in value or []:
+                    session = self._session_from_record(raw, lazy=True)
+                    if session is not None:
+                        self.sessions.append(session)
+            else:
+                self._apply_setting(key, value)
+
+    def _rebuild_index(self) -> None:
+        # Lists every session that still has a shard, an archive or a place in
+        # the snapshot. Shards and archives carry no metadata, so titles come
+        # from the first user message and times from the messages and files.
+        self.sessions = []
+        self.active_session_id = None
+        found: Dict[str, ChatSession] = {}
+        snap = open_snapshot(self.snapshot_path)
+        if snap is not None:
+            for key, value in snap.settings.items():
+                self._apply_setting(key, value)
+            self.active_session_id = None
+        for archived, directory, suffix in (
+            (False, self.sessions_dir, ".json"),
+            (True, self.archive_dir, ".json.xz"),
+        ):
+            if not directory.is_dir():
+                continue
+            for path in directory.glob("*" + suffix):
+                sid = path.name[:-len(suffix)]
+                if sid in found:
+                    continue
+                try:
+                    mtime_us = int(path.stat().st_mtime * 1_000_000)
+                    messages = self._read_session_messages(sid, archived=archived)
+                except (OSError, ValueError, lzma.LZMAError):
+                    continue
+                title = next(
+                    (m.content.strip().splitlines()[0][:60] for m in messages if m.role == "user" and m.content.strip()),
+                    "Recovered Chat",
+                )
+                first = messages[0].created_ts if messages else None
+                found[sid] = ChatSession(
+                    id=sid,
+                    title=title,
+                    model_id=self.settings.current_model,
+                    created_at=format_ts(first if isinstance(first, int) else mtime_us),
+                    updated_at=format_ts(mtime_us),
+                    loader=self._loader_for(sid, archived),
+                    archived=archived,
+                )
+        if snap is not None:
+            for meta in snap.sessions:
+                if meta.get("id") in found:
+                    continue
+                session = self._session_from_record(meta, lazy=True)
+                if session is not None:
+                    found[session.id] = session
+                    self._snapshot_ids.add(session.id)
+            if self._snapshot_ids:
+                self._snapshot = snap
+            else:
+                snap.close()
+        self.sessions = sorted(found.values(), key=lambda s: s.updated_at, reverse=True)
+        if self.sessions:
+            self.active_session_id = self.sessions[0].id
+        self._index_text = None
+        self.save()
+
+    def _peek_active_session(self) -> Optional[str]:
+        # Files written by older versions put the settings after the sessions,
+        # so look in the tail for the active id before streaming.
+        try:
+            with self.storage_path.open("rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - _TAIL_BYTES))
+                tail = f.read().decode("utf-8", errors="ignore")
+        except OSError:
+            return None
+        matches = _ACTIVE_RE.findall(tail)
+        return matches[-1] if matches else None
+
+    def _stream_load(self) -> None:
+        active = self._peek_active_session()
+        f = self.storage_path.open("r", encoding="utf-8")
+        items = JsonStream(f, stream_keys=(SESSIONS_KEY,)).items()
+        self.sessions = []
+        self.active_session_id = active
+        for key, value in items:
+            if key != SESSIONS_KEY:
+                self._apply_setting(key, value)
+                continue
+            session = self._session_from_record(value)
+            if session is None:
+                continue
+            self.sessions.append(session)
+            if session.id == self.active_session_id:
+                break
+        else:
+            f.close()
+            return
+        # The active session is ready to show; the rest of the file is read on a
+        # worker. Non-daemon so a save requested meanwhile still lands on exit.
+        self._loaded.clear()
+        threading.Thread(target=self._finish_load, args=(f, items), name="pytalk-load").start()
+
+    def _finish_load(self, f: IO[str], items: Iterator[Tuple[str, Any]]) -> None:
+        try:
+            for key, value in items:
+                if key != SESSIONS_KEY:
+                    with self._lock:
+                        self._apply_setting(key, value)
+                    continue
+                session = self._session_from_record(value)
+                if session is not None:
+                    with self._lock:
+                        self.sessions.append(session)
+        finally:
+            f.close()
+            with self._lock:
+                self._loaded.set()
+                pending, self._save_pending = self._save_pending, False
+            if pending:
+                self.save()
+            self._emit("loaded")
+
+    def is_loaded(self) -> bool:
+        return self._loaded.is_set()
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        return self._loaded.wait(timeout)
+
+    def mark_dirty(self, session_id: str) -> None:
+        with self._lock:
+            self._dirty.add(session_id)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # save() calls inside the block, from any thread, only leave their
+        # sessions dirty; the outermost block saves once when it ends
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                outermost = self._batch_depth == 0
+            if outermost:
+                self.save()
+
+    def add_sessions(self, sessions: Iterable[ChatSession]) -> int:
+        # Appends fully built sessions (e.g. imported ones) without saving;
+        # they are written by the next save()
+        added = 0
+        with self._lock:
+            for s in sessions:
+                self.sessions.append(s)
+                self._dirty.add(s.id)
+                added += 1
+        if added:
+            self._emit("sessions-added", added)
+        return added
+
+    def unload_sessions(self, session_ids: Iterable[str]) -> None:
+        # Drops saved histories from memory; they reload from disk when opened
+        with self._lock:
+            by_id = {s.id: s for s in self.sessions}
+            for sid in session_ids:
+                s = by_id.get(sid)
+                if s is not None and s.is_materialized() and sid not in self._dirty \
+                        and sid != self.active_session_id:
+                    s.unload(self._loader_for(sid, s.archived))
+
     def save(self) -> None:
-        self.storage_dir.mkdir(parents=True, exist_ok=True)
-        with self.storage_path.open("w", encoding="utf-8") as f:
-            json.dump(self.to_payload(), f, ensure_ascii=False, indent=2)
+        with self._lock:
+            if not self._loaded.is_set():
+                # Writing now would drop the sessions still being read
+                self._save_pending = True
+                return
+            if self._batch_depth:
+                return
+            if self._migrating:
+                self._dirty.update(s.id for s in self.sessions)
+            self.sessions_dir.mkdir(parents=True, exist_ok=True)
+            by_id = {s.id: s for s in self.sessions}
+            for sid in self._dirty:
+                s = by_id.get(sid)
+                if s is not None and s.is_materialized():
+                    record = {"id": s.id, "messages": [m.to_dict() for m in s.messages]}
+                    _write_atomic(self._session_path(sid), json.dumps(record, ensure_ascii=False))
+                    self._snapshot_ids.discard(sid)
+            self._snapshot_ids -= self._deleted
+            for sid in self._deleted:
+                self._session_path(sid).unlink(missing_ok=True)
+                self._archive_path(sid).unlink(missing_ok=True)
+            for sid in self._rehydrated - self._deleted:
+                # The hot copy was written above, so the archived one can go
+                self._archive_path(sid).unlink(missing_ok=True)
+            self._dirty.clear()
+            self._deleted.clear()
+            self._rehydrated.clear()
+            index = self._settings_payload()
+            index[INDEX_KEY] = [s.meta() for s in self.sessions]
+            if self._snapshot_ids:
+                index[SNAPSHOT_KEY] = sorted(self._snapshot_ids)
+            text = json.dumps(index, ensure_ascii=False, indent=2)
+            if text != self._index_text:
+                _write_atomic(self.index_path, text)
+                self._index_text = text
+            if self._snapshot is not None and not self._snapshot_ids:
+                # Every session has moved out of the snapshot
+                self._snapshot.close()
+                self._snapshot = None
+                self.snapshot_path.unlink(missing_ok=True)
+            if self._migrating:
+                self._migrating = False
+                os.replace(self.storage_path, self.storage_path.with_name("pytalk.json.migrated"))
 
     # Sessions
     def create_session(self, title: str, model_id: Optional[str] = None) -> ChatSession:
@@ -130,7 +666,9 @@ class AppState:
             model_id=model_id or self.settings.current_model,
             messages=[],
         )
-        self.sessions.insert(0, session)
+        with self._lock:
+            self.sessions.insert(0, session)
+            self._dirty.add(sid)
         self.active_session_id = sid
         self.save()
         return session
@@ -144,7 +682,11 @@ class AppState:
         self.save()
 
     def delete_session(self, session_id: str) -> None:
-        self.sessions = [s for s in self.sessions if s.id != session_id]
+        with self._lock:
+            self.sessions = [s for s in self.sessions if s.id != session_id]
+            self._dirty.discard(session_id)
+            self._deleted.add(session_id)
+        self._emit("session-deleted", session_id)
         if not self.sessions:
             s = self.create_session("New Chat")
             self.active_session_id = s.id
@@ -154,9 +696,187 @@ class AppState:
         self.save()
 
     def set_active_session(self, session_id: str) -> None:
-        if self.get_session(session_id):
+        s = self.get_session(session_id)
+        if s:
+            if s.archived:
+                self._rehydrate(s)
             self.active_session_id = session_id
+            self.unread.discard(session_id)
+            self.save()
+
+    def mark_unread(self, session_id: str) -> None:
+        if session_id != self.active_session_id:
+            self.unread.add(session_id)
+
+    # Archive
+    def _rehydrate(self, s: ChatSession) -> None:
+        # Materialised before the flag is cleared: a read error propagates with
+        # the session still archived, and an unreadable archive has been moved
+        # aside by then, so save() never deletes an archive it did not read.
+        with self._lock:
+            s.messages
+            s.archived = False
+            self._dirty.add(s.id)
+            self._rehydrated.add(s.id)
+
+    def archive_inactive(self, now_ts: Optional[int] = None) -> int:
+        # Safe to call from a worker: compression happens outside the lock and
+        # a session touched meanwhile is left hot.
+        if not self._loaded.is_set() or self.settings.archive_after_days <= 0:
+            return 0
+        cutoff = (now_ts or now_us()) - self.settings.archive_after_days * 86400 * 1_000_000
+        with self._lock:
+            candidates = [
+                (s, s.updated_at) for s in self.sessions
+                if not s.archived and s.id != self.active_session_id and s.id not in self._dirty
+                and (parse_ts(s.updated_at) or 0) < cutoff
+            ]
+        archived = 0
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        for s, stamp in candidates:
+            if s.is_materialized():
+                record = {"id": s.id, "messages": [m.to_dict() for m in s.messages]}
+                data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+            else:
+                try:
+                    data = self._session_path(s.id).read_bytes()
+                except OSError:
+                    continue
+            tmp = self._archive_path(s.id).with_suffix(".tmp")
+            tmp.write_bytes(lzma.compress(data, preset=6))
+            with self._lock:
+                if s.updated_at != stamp or s.id in self._dirty or s.id == self.active_session_id \
+                        or self.get_session(s.id) is not s:
+                    tmp.unlink(missing_ok=True)
+                    continue
+                os.replace(tmp, self._archive_path(s.id))
+                self._session_path(s.id).unlink(missing_ok=True)
+                self._snapshot_ids.discard(s.id)
+                s.archived = True
+                s.unload(self._loader_for(s.id, archived=True))
+                archived += 1
+        if archived:
             self.save()
+            self._emit("archived", archived)
+        return archived
+
+    # Snapshot
+    def save_snapshot(self, path: Optional[Path] = None) -> Path:
+        # Writes every session to a binary snapshot, one history in memory at
+        # a time. Written to this state's own pytalk.snap, the snapshot then
+        # backs every session that did not change meanwhile and their shard
+        # and archive files are removed.
+        self._loaded.wait()
+        path = path or self.snapshot_path
+        adopt = path == self.snapshot_path
+        with self._lock:
+            sessions = list(self.sessions)
+            settings = self._settings_payload()
+        stamps: Dict[str, str] = {}
+
+        def records() -> Iterator[Tuple[Dict[str, Any], List[Message]]]:
+            for s in sessions:
+                stamps[s.id] = s.updated_at
+                meta = s.meta()
+                meta.pop("archived", None)
+                if s.is_materialized():
+                    yield meta, list(s.messages)
+                else:
+                    yield meta, self._read_session_messages(s.id, archived=s.archived)
+
+        target = path.with_name(path.name + ".new") if adopt else path
+        write_snapshot(target, settings, records())
+        if not adopt:
+            return path
+        with self._lock:
+            # The open snapshot may be the file being replaced
+            if self._snapshot is not None:
+                self._snapshot.close()
+            os.replace(target, path)
+            self._snapshot = open_snapshot(path)
+            adopted = [
+                s for s in sessions
+                if s.id not in self._dirty and s.updated_at == stamps.get(s.id)
+                and self.get_session(s.id) is s
+            ] if self._snapshot is not None else []
+            self._snapshot_ids = {s.id for s in adopted}
+            for s in adopted:
+                if s.archived:
+                    s.archived = False
+                    if not s.is_materialized():
+                        s.unload(self._loader_for(s.id, archived=False))
+            self._index_text = None
+            self.save()
+            for s in adopted:
+                self._session_path(s.id).unlink(missing_ok=True)
+                self._archive_path(s.id).unlink(missing_ok=True)
+        return path
+
+    def load_snapshot(self, path: Path) -> bool:
+        # Replaces sessions and settings with a snapshot's, reading only its
+        # header and metadata; histories stay in the file until opened. A
+        # snapshot from elsewhere is copied in as this state's pytalk.snap.
+        with self._lock:
+            if path != self.snapshot_path:
+                snap = open_snapshot(path)
+                if snap is None:
+                    return False
+                snap.close()
+                if self._snapshot is not None:
+                    self._snapshot.close()
+                    self._snapshot = None
+                shutil.copyfile(path, self.snapshot_path)
+            elif self._snapshot is not None:
+                self._snapshot.close()
+                self._snapshot = None
+            snap = open_snapshot(self.snapshot_path)
+            if snap is None:
+                return False
+            previous = {s.id for s in self.sessions}
+            self._snapshot = snap
+            self.sessions = []
+            self.active_session_id = None
+            for key, value in snap.settings.items():
+                self._apply_setting(key, value)
+            for meta in snap.sessions:
+                session = self._session_from_record(meta, lazy=True)
+                if session is not None:
+                    self.sessions.append(session)
+            self._snapshot_ids = {s.id for s in self.sessions}
+            removed = previous - self._snapshot_ids
+            self._dirty.clear()
+            self._deleted.update(removed)
+            self._migrating = False
+        self.save()
+        for sid in removed:
+            self._emit("session-deleted", sid)
+        return True
+
+    def memory_stats(self) -> Dict[str, int]:
+        # Only materialised histories cost memory; the rest is metadata
+        sessions = list(self.sessions)
+        loaded = [s for s in sessions if s.is_materialized()]
+        seen: set = set()
+        return {
+            "sessions": len(sessions),
+            "materialized": len(loaded),
+            "messages": sum(len(s.messages) for s in loaded),
+            "metadata_bytes": sum(deep_size(s.meta(), seen) for s in sessions),
+            "bytes": sum(deep_size(s.messages, seen) for s in loaded),
+        }
+
+    def referenced_images(self) -> Set[str]:
+        # Every image path any message points at; sessions that are not in
+        # memory are read from disk without being materialised
+        refs: Set[str] = set()
+        for s in list(self.sessions):
+            if s.is_materialized():
+                messages = list(s.messages)
+            else:
+                messages = self._read_session_messages(s.id, archived=s.archived)
+            for m in messages:
+                refs.update(m.images)
+        return refs
 
     def get_session(self, session_id: Optional[str]) -> Optional[ChatSession]:
         if not session_id:
@@ -172,7 +892,9 @@ class AppState:
             return
         s.messages.append(message)
         s.updated_at = iso_now()
+        self.mark_dirty(session_id)
         self.save()
+        self._emit("message-appended", session_id, len(s.messages) - 1)
 
     # Models
     def add_model(self, name: str, model_id: str) -> None:
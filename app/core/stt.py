@@ -1,17 +1,110 @@
 from __future__ import annotations
 
+import queue
 import threading
-from typing import Callable, Optional
+import time
+import wave
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
 
+import numpy as np
 import speech_recognition as sr
 
+from app.core.stt_backends import (
+    LatencyStats,
+    RecognizerBackend,
+    fallback_warning,
+    make_backend,
+    transcribe_directory,
+)
+from app.core.vad import EnergyVAD
+
+SAMPLE_RATE = 16000
+CALIBRATE_S = 0.5
+# Phrases waiting for recognition before capture starts dropping them
+PHRASE_QUEUE = 8
+# How long a new dictation waits for the previous capture thread to let go of
+# the microphone; it exits after the chunk it is reading
+CAPTURE_EXIT_S = 1.0
+
+
+class MicrophoneStream:
+    # Keeps one microphone stream open for the whole dictation
+    def __init__(self, sample_rate: int = SAMPLE_RATE, chunk: int = 1024) -> None:
+        self.sample_rate = sample_rate
+        self._chunk = chunk
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        with sr.Microphone(sample_rate=self.sample_rate, chunk_size=self._chunk) as source:
+            self.sample_rate = source.SAMPLE_RATE
+            while True:
+                yield np.frombuffer(source.stream.read(self._chunk), dtype=np.int16)
+
+
+class WavFileStream:
+    # Replays a recorded WAV file as if it came from the microphone;
+    # `realtime` paces the chunks at the recording's speed
+    def __init__(self, path: Path, chunk: int = 1024, realtime: bool = False) -> None:
+        self.path = path
+        self._chunk = chunk
+        self._realtime = realtime
+        with wave.open(str(path), "rb") as w:
+            self.sample_rate = w.getframerate()
+
+    def chunks(self) -> Iterator[np.ndarray]:
+        with wave.open(str(self.path), "rb") as w:
+            if w.getsampwidth() != 2:
+                raise ValueError(f"{self.path}: only 16-bit PCM is supported")
+            channels = w.getnchannels()
+            while True:
+                frames = w.readframes(self._chunk)
+                if not frames:
+                    return
+                samples = np.frombuffer(frames, dtype=np.int16)
+                if channels > 1:
+                    samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+                if self._realtime:
+                    time.sleep(len(samples) / float(self.sample_rate))
+                yield samples
+
 
 class SpeechToText:
-    def __init__(self) -> None:
+    def __init__(self, backend: str = "google") -> None:
         self._recognizer = sr.Recognizer()
+        self.backend: RecognizerBackend = make_backend(backend)
+        # Set when the chosen engine is not installed and Google is used instead
+        self.backend_warning: Optional[str] = fallback_warning(backend)
+        self.stats = LatencyStats()
         self._listening = False
         self._thread: Optional[threading.Thread] = None
         self._stop_flag = False
+        # Continuous mode: capture thread -> phrase queue -> recognition thread.
+        # The noise floor from the first calibration is kept for later sessions.
+        self._noise_floor: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._workers: list = []
+        self._capture: Optional[threading.Thread] = None
+
+    def set_backend(self, name: str) -> None:
+        self.backend_warning = fallback_warning(name)
+        if name != self.backend.name:
+            self.backend = make_backend(name)
+
+    def _recognize(self, audio: sr.AudioData) -> str:
+        backend = self.backend
+        start = time.perf_counter()
+        try:
+            return backend.recognize(audio)
+        finally:
+            self.stats.record(backend.name, time.perf_counter() - start)
+
+    def transcribe_directory(
+        self,
+        directory: Path,
+        workers: Optional[int] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict[Path, str]:
+        return transcribe_directory(directory, self.backend.name, workers, self.stats, on_progress)
 
     def is_listening(self) -> bool:
         return self._listening
@@ -33,7 +126,7 @@ class SpeechToText:
                 if self._stop_flag:
                     self._listening = False
                     return
-                text = self._recognizer.recognize_google(audio)
+                text = self._recognize(audio)
                 on_text(text)
             except Exception:
                 # ignore recognition errors
@@ -46,6 +139,101 @@ class SpeechToText:
 
     def stop(self) -> None:
         self._stop_flag = True
+        self._stop_event.set()
         self._listening = False
 
+    # Continuous dictation
+    def listen_continuous(self, on_text: Callable[[str], None], source=None) -> bool:
+        # on_text is called from the recognition thread, once per phrase, in
+        # order; phrases captured before stop() are still recognized. After
+        # stop(), a new dictation only starts once the previous capture thread
+        # has closed its stream, so two are never open. Returns False when it
+        # did not start because that stream is still held.
+        if self._listening:
+            return True
+        if self._capture is not None:
+            self._capture.join(CAPTURE_EXIT_S)
+            if self._capture.is_alive():
+                return False
+        self._listening = True
+        stop = self._stop_event = threading.Event()
+        source = source or MicrophoneStream()
+        phrases: "queue.Queue[Optional[np.ndarray]]" = queue.Queue(maxsize=PHRASE_QUEUE)
+        rate = [source.sample_rate]
+
+        def capture() -> None:
+            try:
+                vad: Optional[EnergyVAD] = None
+                calibration = []
+                for chunk in source.chunks():
+                    if stop.is_set():
+                        break
+                    if vad is None:
+                        # The microphone may only report its real rate once opened
+                        rate[0] = source.sample_rate
+                        vad = EnergyVAD(rate[0])
+                        vad.noise_floor = self._noise_floor
+                    if vad.noise_floor is None:
+                        calibration.append(chunk)
+                        if sum(map(len, calibration)) >= rate[0] * CALIBRATE_S:
+                            vad.calibrate(np.concatenate(calibration))
+                            self._noise_floor = vad.noise_floor
+                        continue
+                    for phrase in vad.process(chunk):
+                        self._offer(phrases, phrase)
+                    self._noise_floor = vad.noise_floor
+                if vad is not None:
+                    phrase = vad.flush()
+                    if phrase is not None:
+                        self._offer(phrases, phrase)
+            except Exception:
+                pass
+            finally:
+                # The end marker waits for room; recognition drains the queue
+                # unless it has died
+                while workers[1].is_alive():
+                    try:
+                        phrases.put(None, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+
+        def recognize() -> None:
+            try:
+                while True:
+                    phrase = phrases.get()
+                    if phrase is None:
+                        return
+                    audio = sr.AudioData(phrase.tobytes(), rate[0], 2)
+                    try:
+                        text = self._recognize(audio)
+                    except Exception:
+                        # unintelligible phrase or recognition error
+                        continue
+                    if text:
+                        on_text(text)
+            finally:
+                if self._stop_event is stop:
+                    self._listening = False
+
+        self._capture = threading.Thread(target=capture, name="pytalk-stt-capture", daemon=True)
+        workers = self._workers = [
+            self._capture,
+            threading.Thread(target=recognize, name="pytalk-stt-recognize", daemon=True),
+        ]
+        # Recognition first, so capture can always hand it the end marker
+        for t in reversed(workers):
+            t.start()
+        return True
+
+    def _offer(self, phrases: "queue.Queue[Optional[np.ndarray]]", phrase: np.ndarray) -> None:
+        # Never block capture: if recognition is this far behind, drop the phrase
+        try:
+            phrases.put_nowait(phrase)
+        except queue.Full:
+            pass
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        for t in self._workers:
+            t.join(timeout)
 
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import speech_recognition as sr
+
+AUDIO_SUFFIXES = (".wav", ".aiff", ".aif", ".flac")
+
+
+class RecognizerBackend(ABC):
+    # One speech engine behind speech_recognition. `local` engines run on this
+    # machine (no network, CPU-bound); the others are a web round trip.
+    # `requires` are the modules it imports, `package` what pip installs.
+    name = ""
+    label = ""
+    local = False
+    requires: Tuple[str, ...] = ()
+    package = ""
+
+    def __init__(self) -> None:
+        self._recognizer = sr.Recognizer()
+
+    @classmethod
+    def available(cls) -> bool:
+        return all(importlib.util.find_spec(mod) is not None for mod in cls.requires)
+
+    @abstractmethod
+    def recognize(self, audio: sr.AudioData) -> str:
+        ...
+
+
+class GoogleBackend(RecognizerBackend):
+    name = "google"
+    label = "Google Web Speech (online)"
+
+    def recognize(self, audio: sr.AudioData) -> str:
+        return self._recognizer.recognize_google(audio)
+
+
+class SphinxBackend(RecognizerBackend):
+    name = "sphinx"
+    label = "CMU Sphinx (offline)"
+    local = True
+    requires = ("pocketsphinx",)
+    package = "pocketsphinx"
+
+    def recognize(self, audio: sr.AudioData) -> str:
+        return self._recognizer.recognize_sphinx(audio)
+
+
+class WhisperBackend(RecognizerBackend):
+    name = "whisper"
+    label = "Whisper base (offline)"
+    local = True
+    requires = ("whisper",)
+    package = "openai-whisper"
+
+    def recognize(self, audio: sr.AudioData) -> str:
+        # speech_recognition keeps the loaded model on the recognizer
+        return self._recognizer.recognize_whisper(audio, model="base").strip()
+
+
+BACKENDS: Dict[str, type] = {b.name: b for b in (GoogleBackend, SphinxBackend, WhisperBackend)}
+
+
+def available_backends() -> List[type]:
+    return [b for b in BACKENDS.values() if b.available()]
+
+
+def _resolve(name: str) -> type:
+    cls = BACKENDS.get(name)
+    if cls is None or not cls.available():
+        return GoogleBackend
+    return cls
+
+
+def fallback_warning(name: str) -> Optional[str]:
+    # What to tell the user when `name` cannot be used and Google is used instead
+    cls = BACKENDS.get(name)
+    if _resolve(name) is cls:
+        return None
+    if cls is None:
+        return f"Unknown speech recognition engine \"{name}\"; using {GoogleBackend.label} instead."
+    return (
+        f"{cls.label} needs the \"{cls.package}\" package (pip install {cls.package}); "
+        f"using {GoogleBackend.label} instead."
+    )
+
+
+def make_backend(name: str) -> RecognizerBackend:
+    # Falls back to Google; see fallback_warning()
+    return _resolve(name)()
+
+
+class LatencyStats:
+    # Recognition time per backend over the last `window` phrases
+    def __init__(self, window: int = 100) -> None:
+        self._samples: Dict[str, Deque[float]] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, backend: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(backend, deque(maxlen=self._window)).append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {name: sorted(s) for name, s in self._samples.items() if s}
+        return {
+            name: {
+                "count": len(s),
+                "mean": sum(s) / len(s),
+                "p50": s[len(s) // 2],
+                "p95": s[min(len(s) - 1, int(len(s) * 0.95))],
+                "max": s[-1],
+            }
+            for name, s in snapshot.items()
+        }
+
+
+_worker_backends: Dict[str, RecognizerBackend] = {}
+
+
+def _transcribe_file(backend_name: str, path: str) -> Tuple[str, float]:
+    # Pool worker: each worker loads its engine once and reuses it
+    backend = _worker_backends.get(backend_name)
+    if backend is None:
+        backend = _worker_backends[backend_name] = make_backend(backend_name)
+    with sr.AudioFile(path) as source:
+        audio = backend._recognizer.record(source)
+    start = time.perf_counter()
+    try:
+        text = backend.recognize(audio)
+    except sr.UnknownValueError:
+        text = ""
+    return text, time.perf_counter() - start
+
+
+def transcribe_directory(
+    directory: Path,
+    backend: str = "google",
+    workers: Optional[int] = None,
+    stats: Optional[LatencyStats] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[Path, str]:
+    # Local engines are CPU-bound and go to a process pool; web engines are
+    # I/O-bound and overlap their round trips on threads. Failed files map to
+    # "". Progress counts files as they finish, in whatever order that is.
+    paths = sorted(p for p in directory.iterdir() if p.suffix.lower() in AUDIO_SUFFIXES)
+    cls = _resolve(backend)
+    workers = workers or os.cpu_count() or 1
+    pool: Executor = ProcessPoolExecutor(workers) if cls.local else ThreadPoolExecutor(workers)
+    results: Dict[Path, str] = {}
+    with pool:
+        futures = {pool.submit(_transcribe_file, cls.name, str(p)): p for p in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                text, seconds = future.result()
+            except Exception:
+                text = ""
+            else:
+                if stats is not None:
+                    stats.record(cls.name, seconds)
+            results[path] = text
+            if on_progress:
+                on_progress(done, len(paths))
+    return results
+
+
+if __name__ == "__main__":
+    # python -m app.core.stt_backends <directory> [backend]
+    if len(sys.argv) < 2:
+        sys.exit(f"usage: python -m app.core.stt_backends <directory> [{'|'.join(BACKENDS)}]")
+    name = sys.argv[2] if len(sys.argv) > 2 else GoogleBackend.name
+    warning = fallback_warning(name)
+    if warning:
+        print(warning, file=sys.stderr)
+    latency = LatencyStats()
+    texts = transcribe_directory(
+        Path(sys.argv[1]),
+        name,
+        stats=latency,
+        on_progress=lambda done, total: print(f"{done}/{total}", end="\n" if done == total else "\r", file=sys.stderr),
+    )
+    print(json.dumps({
+        "transcripts": {str(p): text for p, text in texts.items()},
+        "latency": latency.summary(),
+    }, indent=2))
@@ -1,20 +1,288 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import queue
+import re
+import struct
+import sys
 import threading
-from typing import Optional
+import time
+import wave
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
 
 import pyttsx3
 
+# Sentences waiting to be spoken; a reply longer than this is cut short
+# rather than blocking the caller
+QUEUE_SIZE = 256
+CACHE_BYTES = 64 * 1024 * 1024
 
-class TextToSpeech:
+_FENCE = re.compile(r"^[ \t]*(?:```|~~~)[^\n]*(?:\n|$)", re.M)
+_BOUNDARY = re.compile(r"(?<=[.!?])[ \t]+|\n+")
+_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_LINE_MARK = re.compile(r"^\s*(?:#+|[-*+>]|\d+[.)])\s+")
+_INLINE_MARK = re.compile(r"[`*_~]+")
+_SPACE = re.compile(r"\s+")
+_WORD = re.compile(r"\w")
+
+
+def _clean(sentence: str) -> str:
+    text = _LINK.sub(r"\1", sentence)
+    text = _LINE_MARK.sub("", text)
+    text = _INLINE_MARK.sub("", text)
+    text = _SPACE.sub(" ", text).strip()
+    return text if _WORD.search(text) else ""
+
+
+class SentenceSplitter:
+    # Turns markdown arriving in arbitrary chunks into speakable sentences.
+    # A sentence is released as soon as its terminator and the following
+    # whitespace (or a line break) have arrived; fenced code is dropped.
     def __init__(self) -> None:
-        self._engine = pyttsx3.init()
-        self._engine.setProperty("rate", 185)
-        self._engine.setProperty("volume", 1.0)
+        self._buf = ""
+        self._in_code = False
+
+    def feed(self, text: str) -> List[str]:
+        self._buf += text
+        out: List[str] = []
+        while True:
+            fence = _FENCE.search(self._buf)
+            if self._in_code:
+                if fence is None:
+                    # Keep only the last, possibly incomplete, line: it may be the closing fence
+                    self._buf = self._buf[self._buf.rfind("\n") + 1:]
+                    break
+                self._buf = self._buf[fence.end():]
+                self._in_code = False
+                continue
+            if fence is None:
+                self._buf = self._split(self._buf, out)
+                break
+            # The fence ends whatever sentence precedes it
+            rest = self._split(self._buf[:fence.start()], out)
+            out.append(rest)
+            self._buf = self._buf[fence.end():]
+            self._in_code = True
+        return [s for s in map(_clean, out) if s]
+
+    def flush(self) -> List[str]:
+        rest = "" if self._in_code else self._buf
+        self._buf = ""
+        self._in_code = False
+        rest = _clean(rest)
+        return [rest] if rest else []
+
+    @staticmethod
+    def _split(prose: str, out: List[str]) -> str:
+        start = 0
+        for m in _BOUNDARY.finditer(prose):
+            out.append(prose[start:m.start()])
+            start = m.end()
+        return prose[start:]
+
+
+def split_sentences(text: str) -> List[str]:
+    splitter = SentenceSplitter()
+    return splitter.feed(text) + splitter.flush()
+
+
+def audio_suffix(path: Path) -> Optional[str]:
+    # The engine picks the container (macOS writes AIFF whatever the name)
+    with path.open("rb") as f:
+        head = f.read(12)
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return ".wav"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return ".aiff"
+    return None
+
+
+class AudioCache:
+    # Synthesized sentences as <key>.wav or <key>.aiff, evicted least recently
+    # played first once the directory exceeds max_bytes. File mtimes carry the
+    # recency across runs. Only the speech worker touches it.
+    SUFFIXES = (".wav", ".aiff")
+
+    def __init__(self, directory: Path, max_bytes: int = CACHE_BYTES) -> None:
+        self.dir = directory
+        self.max_bytes = max_bytes
+        self.dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for p in self.dir.iterdir():
+            if p.name.endswith(".tmp"):
+                p.unlink(missing_ok=True)
+                continue
+            if p.suffix not in self.SUFFIXES:
+                continue
+            st = p.stat()
+            entries.append((st.st_mtime, p.stem, p.suffix, st.st_size))
+        entries.sort()
+        # key -> (suffix, size)
+        self._files: "OrderedDict[str, Tuple[str, int]]" = OrderedDict(
+            (k, (suffix, size)) for _, k, suffix, size in entries
+        )
+        self._total = sum(size for _, size in self._files.values())
+        self._evict()
+
+    def tmp_path(self, key: str) -> Path:
+        return self.dir / f"{key}.tmp"
+
+    def get(self, key: str) -> Optional[Path]:
+        entry = self._files.get(key)
+        if entry is None:
+            return None
+        p = self.dir / f"{key}{entry[0]}"
+        try:
+            os.utime(p)
+        except OSError:
+            self._total -= self._files.pop(key)[1]
+            return None
+        self._files.move_to_end(key)
+        return p
+
+    def put(self, key: str, tmp: Path, suffix: str) -> Path:
+        p = self.dir / f"{key}{suffix}"
+        os.replace(tmp, p)
+        old = self._files.pop(key, None)
+        if old is not None:
+            self._total -= old[1]
+            if old[0] != suffix:
+                (self.dir / f"{key}{old[0]}").unlink(missing_ok=True)
+        size = p.stat().st_size
+        self._files[key] = (suffix, size)
+        self._total += size
+        self._evict()
+        return p
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and len(self._files) > 1:
+            key, (suffix, size) = self._files.popitem(last=False)
+            self._total -= size
+            (self.dir / f"{key}{suffix}").unlink(missing_ok=True)
+
+
+def _read_pcm(path: Path) -> Tuple[int, int, int, bytes, str]:
+    # (sample width, channels, rate, frames, byte order) of a WAV or an
+    # uncompressed AIFF/AIFC file
+    if path.suffix != ".aiff":
+        with wave.open(str(path), "rb") as w:
+            return w.getsampwidth(), w.getnchannels(), w.getframerate(), w.readframes(w.getnframes()), "<"
+    data = path.read_bytes()
+    kind = data[8:12]
+    pos, channels, width, rate, order, frames = 12, 0, 0, 0, ">", b""
+    while pos + 8 <= len(data):
+        chunk, size = data[pos:pos + 4], struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        body = data[pos + 8:pos + 8 + size]
+        if chunk == b"COMM":
+            channels, _count, bits = struct.unpack(">hIh", body[:8])
+            exponent, mantissa = struct.unpack(">HQ", body[8:18])
+            rate = int(mantissa * 2.0 ** ((exponent & 0x7FFF) - 16383 - 63))
+            width = (bits + 7) // 8
+            if kind == b"AIFC":
+                compression = body[18:22]
+                if compression == b"sowt":
+                    order = "<"
+                elif compression != b"NONE":
+                    raise ValueError(f"{path}: compressed AIFF ({compression!r})")
+        elif chunk == b"SSND":
+            offset = struct.unpack(">I", body[:4])[0]
+            frames = body[8 + offset:]
+        pos += 8 + size + (size & 1)
+    if not (channels and width and rate):
+        raise ValueError(f"{path}: no COMM chunk")
+    return width, channels, rate, frames, order
+
+
+def _audio_duration(path: Path) -> float:
+    width, channels, rate, frames, _order = _read_pcm(path)
+    return len(frames) / float(width * channels * rate or 1)
+
+
+class _SoundDevicePlayer:
+    def __init__(self, sd) -> None:
+        self._sd = sd
+
+    def play(self, path: Path) -> float:
+        import numpy as np
+
+        width, channels, rate, frames, order = _read_pcm(path)
+        if width == 1:
+            # 8-bit WAV is unsigned, 8-bit AIFF signed
+            if path.suffix == ".wav":
+                data = (np.frombuffer(frames, dtype=np.uint8).astype(np.int16) - 128) << 8
+            else:
+                data = np.frombuffer(frames, dtype=np.int8).astype(np.int16) << 8
+        else:
+            data = np.frombuffer(frames, dtype=np.dtype({2: "i2", 4: "i4"}[width]).newbyteorder(order))
+        data = data.reshape(-1, channels)
+        self._sd.play(data, rate)
+        return len(data) / float(rate)
+
+    def stop(self) -> None:
+        self._sd.stop()
+
+
+class _WinsoundPlayer:
+    def __init__(self, winsound) -> None:
+        self._ws = winsound
+
+    def play(self, path: Path) -> float:
+        self._ws.PlaySound(str(path), self._ws.SND_FILENAME | self._ws.SND_ASYNC)
+        return _audio_duration(path)
+
+    def stop(self) -> None:
+        self._ws.PlaySound(None, 0)
+
+
+def _default_player():
+    try:
+        if sys.platform == "win32":
+            import winsound
+
+            return _WinsoundPlayer(winsound)
+        import sounddevice
+
+        return _SoundDevicePlayer(sounddevice)
+    except Exception:
+        # No audio backend: fall back to letting the engine speak directly
+        return None
+
+
+class TextToSpeech:
+    # One long-lived worker owns the engine and speaks queued sentences.
+    # Every reply gets a new generation; sentences from an older generation
+    # are dropped when they reach the front of the queue, so superseding a
+    # reply or stopping playback never has to wait for stale speech.
+    #
+    # With a cache_dir, sentences are synthesized to audio files keyed by
+    # text, voice, rate and volume and played from there, so repeated phrases
+    # skip synthesis. While one sentence plays, the next `presynthesize`
+    # queued sentences are synthesized ahead. If synthesizing to a file fails
+    # the cache is given up and sentences are spoken by the engine directly.
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        presynthesize: int = 2,
+        cache_bytes: int = CACHE_BYTES,
+    ) -> None:
+        self._engine = None
+        self._cache_dir = cache_dir
+        self._cache_bytes = cache_bytes
+        self._cache: Optional[AudioCache] = None
+        self._player = _default_player() if cache_dir is not None else None
+        self._presynthesize = presynthesize
+        self._voice_key = ""
+        self._queue: "queue.Queue[Tuple[int, str]]" = queue.Queue(maxsize=QUEUE_SIZE)
         self._lock = threading.Lock()
-        self._thread: Optional[threading.Thread] = None
-        self._stop_flag = False
+        self._generation = 0
+        self._splitter = SentenceSplitter()
         self._muted = False
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pytalk-tts", daemon=True)
+        self._thread.start()
 
     def set_muted(self, muted: bool) -> None:
         self._muted = muted
@@ -27,22 +295,145 @@ class TextToSpeech:
     def speak(self, text: str) -> None:
         if self._muted or not text.strip():
             return
-        def run() -> None:
-            with self._lock:
-                if self._stop_flag:
-                    return
-                self._engine.say(text)
-                self._engine.runAndWait()
-        self._thread = threading.Thread(target=run, daemon=True)
-        self._thread.start()
+        token = self.begin()
+        self.feed(token, text)
+        self.end(token)
+
+    # Streaming: begin() a reply, feed() chunks as they arrive, end() it.
+    # begin() returns the reply's token; once a newer reply has begun (or
+    # stop() was called), feed() and end() with the old token do nothing, so
+    # replies streaming on different threads never share a splitter.
+    def begin(self) -> int:
+        with self._lock:
+            self._generation += 1
+            self._splitter = SentenceSplitter()
+            token = self._generation
+        self._interrupt()
+        return token
+
+    def feed(self, token: int, chunk: str) -> None:
+        if self._muted:
+            return
+        with self._lock:
+            if token != self._generation:
+                return
+            sentences = self._splitter.feed(chunk)
+        self._enqueue(token, sentences)
+
+    def end(self, token: int) -> None:
+        with self._lock:
+            if token != self._generation:
+                return
+            sentences = self._splitter.flush()
+        if not self._muted:
+            self._enqueue(token, sentences)
 
     def stop(self) -> None:
         with self._lock:
-            self._stop_flag = True
+            self._generation += 1
+            self._splitter = SentenceSplitter()
+        self._interrupt()
+
+    def _enqueue(self, gen: int, sentences: List[str]) -> None:
+        for sentence in sentences:
+            try:
+                self._queue.put_nowait((gen, sentence))
+            except queue.Full:
+                return
+
+    def _interrupt(self) -> None:
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if self._ready.is_set() and self._engine is not None:
             try:
                 self._engine.stop()
             except Exception:
                 pass
-            self._stop_flag = False
+        if self._player is not None:
+            try:
+                self._player.stop()
+            except Exception:
+                pass
+
+    def _run(self) -> None:
+        # Some pyttsx3 drivers must be used from the thread that created them
+        try:
+            self._engine = pyttsx3.init()
+            self._engine.setProperty("rate", 185)
+            self._engine.setProperty("volume", 1.0)
+            self._voice_key = "\0".join(
+                str(self._engine.getProperty(p)) for p in ("voice", "rate", "volume")
+            )
+        except Exception:
+            self._engine = None
+        if self._engine is not None and self._player is not None:
+            try:
+                self._cache = AudioCache(self._cache_dir, self._cache_bytes)
+            except OSError:
+                self._cache = None
+        self._ready.set()
+        while True:
+            gen, sentence = self._queue.get()
+            if gen != self._generation or self._engine is None:
+                continue
+            try:
+                if self._cache is None or not self._play_cached(gen, sentence):
+                    self._engine.say(sentence)
+                    self._engine.runAndWait()
+            except Exception:
+                pass
+
+    def _cache_key(self, sentence: str) -> str:
+        return hashlib.sha256(f"{self._voice_key}\0{sentence}".encode("utf-8")).hexdigest()[:32]
+
+    def _synthesize(self, sentence: str) -> Optional[Path]:
+        cache = self._cache
+        if cache is None:
+            return None
+        key = self._cache_key(sentence)
+        path = cache.get(key)
+        if path is not None:
+            return path
+        tmp = cache.tmp_path(key)
+        try:
+            self._engine.save_to_file(sentence, str(tmp))
+            self._engine.runAndWait()
+            suffix = audio_suffix(tmp) if tmp.exists() and tmp.stat().st_size else None
+            if suffix is None:
+                raise ValueError("the engine wrote no playable audio")
+            return cache.put(key, tmp, suffix)
+        except Exception:
+            tmp.unlink(missing_ok=True)
+            self._cache = None
+            return None
 
+    def _play_cached(self, gen: int, sentence: str) -> bool:
+        # False when the sentence still has to be spoken directly
+        path = self._synthesize(sentence)
+        if path is None:
+            return False
+        if gen != self._generation:
+            return True
+        try:
+            duration = self._player.play(path)
+        except Exception:
+            return False
+        deadline = time.monotonic() + duration
+        for upcoming in self._upcoming(gen):
+            if gen != self._generation:
+                break
+            self._synthesize(upcoming)
+        while gen == self._generation:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.05))
+        return True
 
+    def _upcoming(self, gen: int) -> List[str]:
+        with self._queue.mutex:
+            pending = list(self._queue.queue)[: self._presynthesize]
+        return [sentence for g, sentence in pending if g == gen]
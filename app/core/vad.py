@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from typing import List, Optional
+
+import numpy as np
+
+
+class EnergyVAD:
+    # Splits a mono int16 stream into phrases by frame RMS energy. A frame is
+    # speech when its energy exceeds `ratio` times the noise floor; the floor
+    # is set once by calibrate() and then follows non-speech frames slowly,
+    # so a fan switching on is absorbed but a pause between words is not.
+    def __init__(
+        self,
+        sample_rate: int,
+        frame_ms: int = 30,
+        ratio: float = 3.0,
+        adapt: float = 0.02,
+        min_floor: float = 50.0,
+        min_speech_ms: int = 200,
+        max_silence_ms: int = 600,
+        pre_roll_ms: int = 300,
+        max_phrase_s: float = 15.0,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.frame = max(1, sample_rate * frame_ms // 1000)
+        self.ratio = ratio
+        self.adapt = adapt
+        self.min_floor = min_floor
+        self.noise_floor: Optional[float] = None
+        self._min_speech = max(1, min_speech_ms // frame_ms)
+        self._max_silence = max(1, max_silence_ms // frame_ms)
+        self._pre_roll = pre_roll_ms // frame_ms
+        self._max_frames = int(max_phrase_s * 1000) // frame_ms
+        self._tail = np.zeros(0, dtype=np.int16)
+        self._recent: List[np.ndarray] = []
+        self._phrase: List[np.ndarray] = []
+        self._speech = 0
+        self._silence = 0
+
+    def _energies(self, frames: np.ndarray) -> np.ndarray:
+        return np.sqrt(np.mean(np.square(frames.astype(np.float32)), axis=1))
+
+    def calibrate(self, samples: np.ndarray) -> None:
+        n = len(samples) // self.frame
+        if n == 0:
+            return
+        energies = self._energies(samples[: n * self.frame].reshape(n, self.frame))
+        self.noise_floor = max(float(np.median(energies)), self.min_floor)
+
+    def process(self, samples: np.ndarray) -> List[np.ndarray]:
+        # Returns the phrases completed by these samples
+        samples = np.concatenate((self._tail, samples)) if len(self._tail) else samples
+        n = len(samples) // self.frame
+        self._tail = samples[n * self.frame:]
+        if n == 0:
+            return []
+        frames = samples[: n * self.frame].reshape(n, self.frame)
+        energies = self._energies(frames)
+        if self.noise_floor is None:
+            self.noise_floor = max(float(np.median(energies)), self.min_floor)
+        done: List[np.ndarray] = []
+        for frame, energy in zip(frames, energies):
+            voiced = energy > self.noise_floor * self.ratio
+            if not voiced:
+                self.noise_floor += self.adapt * (max(float(energy), self.min_floor) - self.noise_floor)
+            if self._phrase:
+                self._phrase.append(frame)
+                if voiced:
+                    self._speech += 1
+                    self._silence = 0
+                else:
+                    self._silence += 1
+                if self._silence >= self._max_silence or len(self._phrase) >= self._max_frames:
+                    phrase = self._end_phrase()
+                    if phrase is not None:
+                        done.append(phrase)
+            elif voiced:
+                self._phrase = self._recent + [frame]
+                self._recent = []
+                self._speech = 1
+                self._silence = 0
+            elif self._pre_roll:
+                self._recent.append(frame)
+                if len(self._recent) > self._pre_roll:
+                    del self._recent[0]
+        return done
+
+    def flush(self) -> Optional[np.ndarray]:
+        self._tail = np.zeros(0, dtype=np.int16)
+        self._recent = []
+        return self._end_phrase() if self._phrase else None
+
+    def _end_phrase(self) -> Optional[np.ndarray]:
+        frames, speech = self._phrase, self._speech
+        self._phrase = []
+        self._speech = self._silence = 0
+        if speech < self._min_speech:
+            return None
+        return np.concatenate(frames)
@@ -1,5 +1,6 @@
 import os
 import sys
+import tracemalloc
 from pathlib import Path
 
 from PySide6.QtCore import Qt, QTimer
@@ -7,6 +8,8 @@ from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import QApplication
 
 from app.ui.main_window import MainWindow
+from app.ui.watchdog import StallWatchdog
+from app.core.attachments import attachments
 from app.core.state import AppState
 from app.core.ai_client import GeminiClient
 from app.core.tts import TextToSpeech
@@ -20,6 +23,10 @@ def ensure_app_dirs() -> Path:
 
 
 def main() -> None:
+    # PYTALK_TRACEMALLOC=1 traces from startup, so memory reports
+    # (Ctrl+Shift+M) attribute every allocation
+    if os.environ.get("PYTALK_TRACEMALLOC") == "1":
+        tracemalloc.start(25)
     os.environ.setdefault("QT_ENABLE_HIGHDPI_SCALING", "1")
     app = QApplication(sys.argv)
     app.setApplicationName("PyTalk")
@@ -28,16 +35,28 @@ def main() -> None:
 
     base_dir = ensure_app_dirs()
     state = AppState(storage_dir=base_dir)
+    attachments.open(base_dir / "attachments")
     state.load()
 
     api_key = os.environ.get("GOOGLE_API_KEY", "")
-    ai = GeminiClient(api_key=api_key)
-    tts = TextToSpeech()
-    stt = SpeechToText()
+    # PYTALK_TRANSPORT=rest switches to the pooled REST client;
+    # PYTALK_API_BASE points it elsewhere (e.g. a local stub server)
+    ai = GeminiClient(
+        api_key=api_key,
+        transport=os.environ.get("PYTALK_TRANSPORT", "sdk"),
+        base_url=os.environ.get("PYTALK_API_BASE") or None,
+        http2=os.environ.get("PYTALK_HTTP2", "") == "1",
+    )
+    tts = TextToSpeech(cache_dir=base_dir / "tts-cache")
+    stt = SpeechToText(backend=state.settings.stt_backend)
 
     window = MainWindow(state=state, ai=ai, tts=tts, stt=stt)
     window.show()
 
+    # Logs UI-thread stalls with stacks; `python -m app.ui.watchdog` summarises
+    watchdog = StallWatchdog(base_dir / "stalls.jsonl", parent=window)
+    watchdog.start()
+
     # Initial loading splash timing for aesthetics
     QTimer.singleShot(600, window.hide_loading_show_main)
 
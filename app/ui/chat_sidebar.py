@@ -1,28 +1,48 @@
 from __future__ import annotations
 
-from typing import Callable, Optional
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
 
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QAction, QIcon
 from PySide6.QtWidgets import (
     QAbstractItemView,
+    QFileDialog,
     QHBoxLayout,
     QInputDialog,
+    QLabel,
     QListWidget,
     QListWidgetItem,
+    QMessageBox,
     QPushButton,
     QVBoxLayout,
     QWidget,
 )
 
+from app.core.exporter import SessionExporter
+from app.core.importer import BulkImporter, ImportProgress
 from app.core.state import AppState, ChatSession
 
 
 class ChatSidebar(QWidget):
-    def __init__(self, state: AppState, on_select: Callable[[str], None]) -> None:
+    _export_finished = Signal(str)
+    _import_progress = Signal(str)
+    _import_finished = Signal(str)
+    _snapshot_finished = Signal(str, bool)
+
+    def __init__(
+        self,
+        state: AppState,
+        on_select: Callable[[str], None],
+        on_hover: Optional[Callable[[str], None]] = None,
+        is_pending: Optional[Callable[[str], bool]] = None,
+    ) -> None:
         super().__init__()
         self.state = state
         self.on_select = on_select
+        self.on_hover = on_hover
+        self.is_pending = is_pending
         self.setObjectName("ChatSidebar")
         self.setStyleSheet("""
         #ChatSidebar {
@@ -55,8 +75,23 @@ class ChatSidebar(QWidget):
         self.list.setSelectionMode(QAbstractItemView.SingleSelection)
         self.list.itemSelectionChanged.connect(self._on_selection_changed)
         self.list.itemDoubleClicked.connect(self._rename_selected)
+        # Hover and keyboard focus hint at the next chat to open
+        self.list.setMouseTracking(True)
+        self.list.itemEntered.connect(self._on_item_hinted)
+        self.list.currentItemChanged.connect(lambda current, _previous: self._on_item_hinted(current))
         layout.addWidget(self.list, 1)
 
+        self.import_status = QLabel()
+        self.import_status.setStyleSheet("color: #9ca3af; margin: 4px 8px;")
+        self.import_status.setWordWrap(True)
+        self.import_status.hide()
+        layout.addWidget(self.import_status)
+
+        self._export_finished.connect(self._on_export_finished)
+        self._import_progress.connect(self._on_import_progress)
+        self._import_finished.connect(self._on_import_finished)
+        self._snapshot_finished.connect(self._on_snapshot_finished)
+        self._importing = False
         self._context_menu()
         self.refresh()
 
@@ -66,17 +101,46 @@ class ChatSidebar(QWidget):
         act_rename.triggered.connect(self._rename_selected)
         act_delete = QAction("Delete", self)
         act_delete.triggered.connect(self._delete_selected)
+        act_export = QAction("Export to HTML...", self)
+        act_export.triggered.connect(self._export_selected)
+        act_export_all = QAction("Export All to HTML...", self)
+        act_export_all.triggered.connect(self._export_all)
+        act_import = QAction("Import Chats...", self)
+        act_import.triggered.connect(self._import)
+        act_save_snapshot = QAction("Save Snapshot...", self)
+        act_save_snapshot.triggered.connect(self._save_snapshot)
+        act_open_snapshot = QAction("Open Snapshot...", self)
+        act_open_snapshot.triggered.connect(self._open_snapshot)
         self.list.addAction(act_rename)
         self.list.addAction(act_delete)
+        self.list.addAction(act_export)
+        self.list.addAction(act_export_all)
+        self.list.addAction(act_import)
+        self.list.addAction(act_save_snapshot)
+        self.list.addAction(act_open_snapshot)
 
     def refresh(self) -> None:
-        self.list.clear()
-        for s in self.state.sessions:
-            item = QListWidgetItem(s.title)
-            item.setData(Qt.UserRole, s.id)
-            self.list.addItem(item)
-            if s.id == self.state.active_session_id:
-                item.setSelected(True)
+        # Rebuilding must not look like the user picking a chat
+        self.list.blockSignals(True)
+        try:
+            self.list.clear()
+            for s in self.state.sessions:
+                item = QListWidgetItem(self._label(s))
+                item.setData(Qt.UserRole, s.id)
+                self.list.addItem(item)
+                if s.id == self.state.active_session_id:
+                    item.setSelected(True)
+        finally:
+            self.list.blockSignals(False)
+
+    def _label(self, s: ChatSession) -> str:
+        # ⏳ a reply is on its way, ● a reply arrived while the chat was not open
+        marks = ""
+        if self.is_pending and self.is_pending(s.id):
+            marks += "⏳ "
+        if s.id in self.state.unread:
+            marks += "● "
+        return marks + s.title
 
     def new_chat(self) -> None:
         s = self.state.create_session("New Chat")
@@ -89,8 +153,15 @@ class ChatSidebar(QWidget):
             return
         sid = items[0].data(Qt.UserRole)
         self.state.set_active_session(sid)
+        s = self.state.get_session(sid)
+        if s:
+            items[0].setText(self._label(s))
         self.on_select(sid)
 
+    def _on_item_hinted(self, item: Optional[QListWidgetItem]) -> None:
+        if item is not None and self.on_hover:
+            self.on_hover(item.data(Qt.UserRole))
+
     def _selected_session_id(self) -> Optional[str]:
         items = self.list.selectedItems()
         if not items:
@@ -118,4 +189,113 @@ class ChatSidebar(QWidget):
         if self.state.active_session_id:
             self.on_select(self.state.active_session_id)
 
+    def _export_selected(self) -> None:
+        s = self.state.get_session(self._selected_session_id())
+        if s:
+            self._export([s])
+
+    def _export_all(self) -> None:
+        self._export(list(self.state.sessions))
+
+    def _export(self, sessions: List[ChatSession]) -> None:
+        out = QFileDialog.getExistingDirectory(self, "Export to Folder")
+        if not out:
+            return
+
+        def run() -> None:
+            try:
+                paths = SessionExporter(Path(out), state=self.state).export(sessions)
+                self._export_finished.emit(f"Exported {len(sessions)} chat(s) to {paths[-1]}")
+            except Exception as e:
+                self._export_finished.emit(f"Export failed: {e}")
+        threading.Thread(target=run, daemon=True).start()
+
+    def _on_export_finished(self, text: str) -> None:
+        QMessageBox.information(self, "Export", text)
+
+    def _import(self) -> None:
+        if self._importing:
+            return
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Import Chats", "", "Chat exports (*.json *.jsonl);;All files (*)"
+        )
+        if not path:
+            return
+        self._importing = True
+        self.import_status.setText("Importing…")
+        self.import_status.show()
+
+        def progress(p: ImportProgress) -> None:
+            percent = p.bytes_read * 100 // max(1, p.total_bytes)
+            self._import_progress.emit(f"Importing… {percent}% ({p.conversations} chats, {p.messages} messages)")
 
+        def run() -> None:
+            # Sessions appear batch by batch through the "sessions-added" event;
+            # running it again on the same file resumes where it stopped
+            try:
+                result = BulkImporter(self.state).run(Path(path), on_progress=progress)
+                text = f"Imported {result.sessions} chat(s) with {result.messages} messages."
+                if result.skipped:
+                    text += f"\n{result.skipped} conversation(s) were empty or already imported."
+                if result.truncated:
+                    text += "\nThe file ended early; everything before that point was imported."
+                self._import_finished.emit(text)
+            except Exception as e:
+                self._import_finished.emit(f"Import failed: {e}\nImporting the same file again resumes from the last batch.")
+        threading.Thread(target=run, daemon=True).start()
+
+    def _save_snapshot(self) -> None:
+        path, _ = QFileDialog.getSaveFileName(self, "Save Snapshot", "pytalk.snap", "PyTalk snapshots (*.snap)")
+        if not path:
+            return
+
+        def run() -> None:
+            try:
+                self.state.save_snapshot(Path(path))
+                self._snapshot_finished.emit(f"Saved {len(self.state.sessions)} chat(s) to {path}", False)
+            except Exception as e:
+                self._snapshot_finished.emit(f"Saving the snapshot failed: {e}", False)
+        threading.Thread(target=run, daemon=True).start()
+
+    def _open_snapshot(self) -> None:
+        path, _ = QFileDialog.getOpenFileName(self, "Open Snapshot", "", "PyTalk snapshots (*.snap);;All files (*)")
+        if not path:
+            return
+        answer = QMessageBox.question(
+            self,
+            "Open Snapshot",
+            "Opening a snapshot replaces all chats and settings with the ones it contains. Continue?",
+        )
+        if answer != QMessageBox.Yes:
+            return
+
+        def run() -> None:
+            # Only the header and metadata are read; histories load on open
+            try:
+                if self.state.load_snapshot(Path(path)):
+                    self._snapshot_finished.emit(f"Opened {len(self.state.sessions)} chat(s) from {path}", True)
+                else:
+                    self._snapshot_finished.emit(f"{path} is not a PyTalk snapshot.", False)
+            except Exception as e:
+                self._snapshot_finished.emit(f"Opening the snapshot failed: {e}", False)
+        threading.Thread(target=run, daemon=True).start()
+
+    def _on_snapshot_finished(self, text: str, replaced: bool) -> None:
+        if replaced:
+            if self.state.sessions:
+                self.state.set_active_session(self.state.sessions[0].id)
+            else:
+                self.new_chat()
+            self.refresh()
+            if self.state.active_session_id:
+                self.on_select(self.state.active_session_id)
+        QMessageBox.information(self, "Snapshot", text)
+
+    def _on_import_progress(self, text: str) -> None:
+        self.import_status.setText(text)
+
+    def _on_import_finished(self, text: str) -> None:
+        self._importing = False
+        self.import_status.hide()
+        self.refresh()
+        QMessageBox.information(self, "Import", text)
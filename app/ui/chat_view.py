@@ -1,18 +1,21 @@
 from __future__ import annotations
 
 import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from PIL import Image
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QAction, QGuiApplication, QPixmap
+from PySide6.QtCore import Qt, QTimer, Signal
+from PySide6.QtGui import QAction, QDesktopServices, QGuiApplication, QPixmap
 from PySide6.QtWidgets import (
     QFileDialog,
     QGridLayout,
     QHBoxLayout,
     QLabel,
     QLineEdit,
+    QMessageBox,
     QPushButton,
     QComboBox,
     QTextBrowser,
@@ -22,20 +25,81 @@ from PySide6.QtWidgets import (
 )
 
 from app.core.ai_client import GeminiClient
-from app.core.markdown_renderer import render_markdown
+from app.core.attachments import attachments
+from app.core.context_cache import PrefixCache
+from app.core.dispatcher import RequestDispatcher
+from app.core.image_store import ImageStore
+from app.core.memory import Hit, SemanticMemory
+from app.core.markdown_renderer import highlighter
 from app.core.state import AppState, ChatSession, Message
 from app.core.tts import TextToSpeech
 from app.core.stt import SpeechToText
+from app.ui.message_html import PAGE_SIZE, wrap_bubble
+from app.ui.message_list_view import MessageListView
+from app.ui.prefetch import MessageHtmlCache
+
+
+# Past snippets added to a request from semantic memory
+MEMORY_HITS = 4
 
 
 class ChatView(QWidget):
-    def __init__(self, state: AppState, ai: GeminiClient, tts: TextToSpeech, stt: SpeechToText, parent=None) -> None:
+    _highlight_ready = Signal(str, int)
+    _reply_ready = Signal(str, str)
+    _dictated = Signal(str)
+    _image_progress = Signal(int, int)
+    _attached = Signal(str, str, str)  # source path, reference, error
+    # A request was queued or answered in this session
+    session_activity = Signal(str)
+
+    def __init__(
+        self,
+        state: AppState,
+        ai: GeminiClient,
+        tts: TextToSpeech,
+        stt: SpeechToText,
+        html_cache: Optional[MessageHtmlCache] = None,
+        dispatcher: Optional[RequestDispatcher] = None,
+        images: Optional[ImageStore] = None,
+        memory: Optional[SemanticMemory] = None,
+        prefix_cache: Optional[PrefixCache] = None,
+        parent=None,
+    ) -> None:
         super().__init__(parent)
         self.state = state
         self.ai = ai
         self.tts = tts
         self.stt = stt
         self.attached_image_path: Optional[str] = None
+        self.dispatcher = dispatcher or RequestDispatcher()
+        self._reply_ready.connect(self._on_reply_ready)
+        self._dictated.connect(self._on_dictated)
+        self.images = images or ImageStore(state.storage_dir / "generated")
+        self._image_progress.connect(self._on_image_progress)
+        self._attached.connect(self._on_attached)
+        self._attaching = False
+        self.memory = memory
+        self.prefix_cache = prefix_cache
+        # Only messages from _first_index on are in the document; older pages
+        # are added when the user scrolls to the top. Message bodies come from
+        # a cache shared with the list view and the session prefetcher.
+        self._session_id: Optional[str] = None
+        self._first_index = 0
+        self._paging = False
+        self._html = html_cache or MessageHtmlCache()
+        self._render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pytalk-render")
+        # Code blocks first appear as plain <pre>; highlighting is queued nearest
+        # the visible end first (a session switch drops what was queued), and
+        # the affected bubbles are re-rendered in one batch as results arrive.
+        self._focus_index = 0
+        # Bumped on every session switch; background prerenders stop once it moves
+        self._render_generation = 0
+        self._document_html_bytes = 0
+        self._highlight_ready.connect(self._on_highlight_ready)
+        self._rehighlight = QTimer(self)
+        self._rehighlight.setSingleShot(True)
+        self._rehighlight.setInterval(30)
+        self._rehighlight.timeout.connect(self._apply_highlights)
 
         self.setObjectName("ChatView")
         self.setStyleSheet("""
@@ -74,13 +138,18 @@ class ChatView(QWidget):
         h.addWidget(self.btn_settings, 0)
         layout.addWidget(header, 0)
 
-        # Message area
+        # Message area: one paged QTextBrowser document, or a virtualized
+        # per-message list (Settings.message_view)
         self.web = QTextBrowser()
         self.web.setOpenExternalLinks(True)
         self.web.setOpenLinks(False)
         self.web.anchorClicked.connect(self._handle_anchor_clicked)
         self.web.setStyleSheet("background-color:#0b1020; border:none;")
+        self.web.verticalScrollBar().valueChanged.connect(self._on_scroll)
         layout.addWidget(self.web, 1)
+        self.list_view = MessageListView(self._html)
+        self.list_view.anchorClicked.connect(self._handle_anchor_clicked)
+        layout.addWidget(self.list_view, 1)
 
         # Speaking indicator
         self.speaking = QLabel("")
@@ -116,6 +185,17 @@ class ChatView(QWidget):
 
         self.refresh()
 
+    def document_stats(self) -> Dict[str, int]:
+        # Inline base64 images make the HTML handed to the QTextBrowser the
+        # dominant term; Qt keeps the decoded images on top of that
+        doc = self.web.document()
+        return {
+            "html_bytes": self._document_html_bytes,
+            "chars": doc.characterCount(),
+            "bytes": self._document_html_bytes + doc.characterCount() * 2,
+            "list_view": self.list_view.delegate_stats(),
+        }
+
     # External hooks
     def set_sidebar_toggler(self, cb) -> None:
         self.btn_sidebar.clicked.connect(cb)
@@ -129,32 +209,21 @@ class ChatView(QWidget):
         if not s:
             return
         self.title.setText(s.title)
-        html_parts: List[str] = []
-        for msg in s.messages:
-            bubble_color = "#4f46e5" if msg.role == "user" else "#374151"
-            text_color = "#ffffff" if msg.role == "user" else "#e5e7eb"
-            rnd = render_markdown(msg.content)
-            # Extract body content from rendered HTML
-            idx = rnd.find("<body>")
-            body = rnd[idx + 6:] if idx != -1 else rnd
-            idx2 = body.rfind("</body>")
-            if idx2 != -1:
-                body = body[:idx2]
-            images_html = ""
-            for img_path in msg.images:
-                try:
-                    with open(img_path, "rb") as f:
-                        b64 = base64.b64encode(f.read()).decode("utf-8")
-                    images_html += f'<img src="data:image/*;base64,{b64}" />'
-                except Exception:
-                    pass
-            html_parts.append(f"""
-            <div style="max-width: 72%; margin: 8px; padding: 10px 12px; border-radius: 12px; background:{bubble_color}; color:{text_color}; {'margin-left:auto;' if msg.role=='user' else 'margin-right:auto;'}">
-              {images_html}
-              {body}
-            </div>
-            """)
-        self.web.setHtml(f"<!DOCTYPE html><html><body style='background:#0b1020;'>{''.join(html_parts)}</body></html>")
+        use_list = self.state.settings.message_view == "list"
+        self.web.setVisible(not use_list)
+        self.list_view.setVisible(use_list)
+        if use_list:
+            self._session_id = None
+            self._render_generation += 1
+            self.list_view.show_session(s)
+        else:
+            if s.id != self._session_id:
+                self._session_id = s.id
+                self._first_index = max(0, len(s.messages) - PAGE_SIZE)
+                self._render_generation += 1
+                highlighter.new_generation()
+            self._focus_index = len(s.messages) - 1
+            self._render_window(s)
 
         # Input state
         if self.stt.is_listening():
@@ -164,6 +233,71 @@ class ChatView(QWidget):
         self._update_speaking_indicator()
         self._update_mute_icon()
 
+    def _bubble(self, session: ChatSession, index: int) -> str:
+        pending: List[tuple] = []
+        body = self._html.body(session, index, pending)
+        distance = abs(index - self._focus_index)
+        for code, lang in pending:
+            highlighter.submit(code, lang, distance, lambda sid=session.id, i=index: self._highlight_ready.emit(sid, i),
+                               token=(self, session.id, index))
+        return wrap_bubble(session.messages[index], body)
+
+    def _on_highlight_ready(self, session_id: str, index: int) -> None:
+        # The cached plain body is re-rendered once one of its blocks is done
+        if session_id == self._session_id:
+            self._rehighlight.start()
+
+    def _apply_highlights(self) -> None:
+        s = self.state.get_session(self._session_id)
+        if not s or self.state.settings.message_view == "list":
+            return
+        bar = self.web.verticalScrollBar()
+        self._render_window(s, bar.maximum() - bar.value())
+
+    def _render_window(self, s: ChatSession, from_bottom: int = 0) -> None:
+        # Scroll events are ignored until the restore runs: setHtml() resets the
+        # bar to the top, and the layout is only final after the event loop turns.
+        self._paging = True
+        parts = [self._bubble(s, i) for i in range(self._first_index, len(s.messages))]
+        html = f"<!DOCTYPE html><html><body style='background:#0b1020;'>{''.join(parts)}</body></html>"
+        self._document_html_bytes = len(html)
+        self.web.setHtml(html)
+        QTimer.singleShot(0, lambda: self._restore_scroll(from_bottom))
+        self._prerender_previous_page(s)
+
+    def _prerender_previous_page(self, s: ChatSession) -> None:
+        start = max(0, self._first_index - PAGE_SIZE)
+        indices = [i for i in range(start, self._first_index) if self._html.get(s.id, i) is None]
+        if not indices:
+            return
+
+        generation = self._render_generation
+
+        def run() -> None:
+            for i in indices:
+                if generation != self._render_generation:
+                    return
+                self._html.body(s, i)
+        self._render_pool.submit(run)
+
+    def _on_scroll(self, value: int) -> None:
+        bar = self.web.verticalScrollBar()
+        if self._paging or self._first_index == 0 or value > bar.minimum():
+            return
+        s = self.state.get_session(self._session_id)
+        if not s:
+            return
+        # Keep the message under the viewport where it was once the older page is prepended
+        from_bottom = bar.maximum() - value
+        self._focus_index = self._first_index
+        self._first_index = max(0, self._first_index - PAGE_SIZE)
+        self._render_window(s, from_bottom)
+
+    def _restore_scroll(self, from_bottom: int) -> None:
+        bar = self.web.verticalScrollBar()
+        bar.setValue(bar.maximum() - from_bottom)
+        self._paging = False
+
     def _refresh_models(self) -> None:
         self.model.clear()
         for m in self.state.settings.models:
@@ -204,6 +338,8 @@ class ChatView(QWidget):
                 QGuiApplication.clipboard().setText(text)
             except Exception:
                 pass
+        elif self.state.settings.message_view == "list":
+            QDesktopServices.openUrl(url)
         else:
             self.web.setSource(url)
 
@@ -211,7 +347,28 @@ class ChatView(QWidget):
         path, _ = QFileDialog.getOpenFileName(self, "Attach Image", "", "Images (*.png *.jpg *.jpeg *.webp)")
         if not path:
             return
-        self.attached_image_path = path
+        # Hashing (and, for a new file, copying) runs off the UI thread;
+        # sending waits until the reference is known
+        self._attaching = True
+        self.btn_attach.setEnabled(False)
+        self.btn_send.setEnabled(False)
+
+        def run() -> None:
+            try:
+                # Stored once; the message keeps its hash
+                self._attached.emit(path, attachments.ingest(path), "")
+            except OSError as e:
+                self._attached.emit(path, "", str(e))
+        threading.Thread(target=run, name="pytalk-attach", daemon=True).start()
+
+    def _on_attached(self, path: str, ref: str, error: str) -> None:
+        self._attaching = False
+        self.btn_attach.setEnabled(True)
+        self.btn_send.setEnabled(True)
+        if error:
+            QMessageBox.warning(self, "Attach Image", f"Could not read {path}:\n{error}")
+        else:
+            self.attached_image_path = ref
 
     def _toggle_mic(self) -> None:
         if self.stt.is_listening():
@@ -219,41 +376,93 @@ class ChatView(QWidget):
             self.refresh()
             return
 
-        def on_text(text: str) -> None:
-            current = self.input.toPlainText()
-            new_text = (current + " " + text).strip()
-            self.input.setPlainText(new_text)
-            self.refresh()
-        self.stt.listen(on_text=on_text)
+        # Dictation keeps listening until the mic is toggled off; phrases
+        # arrive on the recognition thread
+        if not self.stt.listen_continuous(on_text=self._dictated.emit):
+            QMessageBox.information(
+                self, "Dictation", "The microphone is still closing from the last dictation. Try again in a moment."
+            )
+        self.refresh()
+
+    def _on_dictated(self, text: str) -> None:
+        current = self.input.toPlainText()
+        new_text = (current + " " + text).strip()
+        self.input.setPlainText(new_text)
         self.refresh()
 
     def _generate_image_from_text(self) -> None:
+        s = self.state.get_session(self.state.active_session_id)
         text = self.input.toPlainText().strip()
-        if not text:
-            return
-        img_bytes = self.ai.generate_image(prompt=text, model_id="gemini-flash-image")
-        if not img_bytes:
+        if not s or not text:
             return
-        # Save to temp file under storage dir
-        out_path = str(self.state.storage_dir / f"gen_{abs(hash(text))}.png")
-        with open(out_path, "wb") as f:
-            f.write(img_bytes)
+        variants = self.state.settings.image_variants
+        self.dispatcher.submit(
+            s.id,
+            lambda: self._run_image_request(s.id, text, variants),
+            lambda done: self._reply_ready.emit(s.id, "") if done else None,
+        )
+        self.session_activity.emit(s.id)
+
+    # Runs on a dispatcher thread, queued behind the session's chat requests
+    def _run_image_request(self, session_id: str, prompt: str, variants: int) -> bool:
+        try:
+            paths = self.images.generate(
+                self.ai.generate_image,
+                prompt,
+                model_id="gemini-flash-image",
+                variants=variants,
+                on_progress=lambda done, total: self._image_progress.emit(done, total),
+            )
+        except Exception as e:
+            self.state.append_message(session_id, Message(role="assistant", content=f"Error: {e}"))
+            return True
+        if not paths:
+            return False
         # Add as assistant message with image
-        s = self.state.get_session(self.state.active_session_id)
-        if not s:
-            return
-        self.state.append_message(s.id, Message(role="assistant", content="Generated image for your prompt.", images=[out_path]))
-        self.refresh()
+        content = "Generated image for your prompt."
+        if len(paths) > 1:
+            content = f"Generated {len(paths)} images for your prompt."
+        self.state.append_message(
+            session_id, Message(role="assistant", content=content, images=[str(p) for p in paths])
+        )
+        return True
+
+    def _on_image_progress(self, done: int, total: int) -> None:
+        if done < total:
+            self.speaking.setText(f"Generating images… {done}/{total}")
+        else:
+            self._update_speaking_indicator()
 
     def _send(self) -> None:
         s = self.state.get_session(self.state.active_session_id)
         if not s:
             return
         text = self.input.toPlainText().strip()
-        if not text and not self.attached_image_path:
+        if self._attaching or (not text and not self.attached_image_path):
             return
 
-        # Title update (asynchronous feel kept simple)
+        # Append user message; the reply is produced off the UI thread, so the
+        # user can keep typing here or switch to another chat meanwhile
+        images = [self.attached_image_path] if self.attached_image_path else []
+        user_msg = Message(role="user", content=text or "(attached image)", images=images)
+        self.state.append_message(s.id, user_msg)
+        self.input.clear()
+        self.attached_image_path = None
+        model_id = self.state.settings.current_model
+        self.dispatcher.submit(
+            s.id,
+            lambda: self._run_request(s.id, user_msg, text, model_id),
+            lambda reply: self._reply_ready.emit(s.id, reply) if reply is not None else None,
+        )
+        self.refresh()
+        self.session_activity.emit(s.id)
+
+    # Runs on a dispatcher thread; requests of one session run in order.
+    # Returns the reply, announced by the dispatcher once the job is dequeued.
+    def _run_request(self, session_id: str, user_msg: Message, text: str, model_id: str) -> Optional[str]:
+        s = self.state.get_session(session_id)
+        if not s:
+            return None
         if s.title == "New Chat" and text:
             try:
                 new_title = self.ai.summarize_title(text)
@@ -262,47 +471,116 @@ class ChatView(QWidget):
             except Exception:
                 pass
 
-        # Append user message
-        images = [self.attached_image_path] if self.attached_image_path else []
-        self.state.append_message(s.id, Message(role="user", content=text or "(attached image)", images=images))
-        self.input.clear()
-        self.attached_image_path = None
-        self.refresh()
-
-        # Prepare messages for Gemini
-        parts: List[dict] = []
-        if images:
-            # one image multimodal
-            parts.append({"text": text or ""})
-            # inline image handled by ai client ._attachment_from_path in chat method via messages
-            # but the SDK expects structured content; we pass text+image parts per message
-        else:
-            parts.append({"text": text})
-
-        # Build history
-        history = []
-        for m in s.messages:
-            role = "user" if m.role == "user" else "model"
-            p = []
-            if m.content:
-                p.append({"text": m.content})
-            for img in m.images:
-                # each image as inline_data
-                p.append(self.ai._attachment_from_path(img))
-            history.append({"role": role, "parts": p})
-
+        # Spoken while it streams when the chat is open at the time of the request
+        speak = session_id == self.state.active_session_id and not self.state.settings.muted
+        # Everything up to the reply can fail (an unreadable image, the memory
+        # index); any failure still ends in a reply so the user sees it
         try:
-            reply = self.ai.chat(
-                model_id=self.state.settings.current_model,
-                messages=history,
-                system_instruction=self.state.settings.system_instruction,
-            )
+            messages, first = self._window_for(s, user_msg)
+            system_instruction = self.state.settings.system_instruction
+            contents = [self._to_content(m) for m in messages]
+            hits: List[Hit] = []
+            if self.memory is not None and text:
+                # Older context comes back by relevance instead of being resent
+                hits = self.memory.search(text, k=MEMORY_HITS, exclude={s.id: first})
+            if self.prefix_cache is not None and self.state.settings.prefix_cache:
+                # Excerpts differ per turn, so they go with the new user turn
+                # and the system instruction plus history stay cacheable
+                note = self._memory_note(hits)
+                if note:
+                    last = contents[-1]
+                    contents[-1] = dict(last, parts=[{"text": note}] + last["parts"])
+                reply = self.prefix_cache.run(
+                    s.id,
+                    model_id,
+                    system_instruction,
+                    contents,
+                    lambda cache, part: self._stream_reply(model_id, part, system_instruction, speak, cache),
+                )
+            else:
+                reply = self._stream_reply(model_id, contents, self._with_memory(system_instruction, hits), speak)
         except Exception as e:
             reply = f"Error: {e}"
 
-        self.state.append_message(s.id, Message(role="assistant", content=reply))
-        if not self.state.settings.muted:
-            self.tts.speak(reply)
-        self.refresh()
+        # Appended here rather than on the UI thread so the next queued
+        # request of this session already sees this reply
+        self.state.append_message(session_id, Message(role="assistant", content=reply))
+        return reply
+
+    def _stream_reply(
+        self,
+        model_id: str,
+        contents: List[dict],
+        system_instruction: Optional[str],
+        speak: bool,
+        cached_content: Optional[str] = None,
+    ) -> str:
+        # The reply is read as it is generated and, with `speak`, each chunk
+        # goes to the speech worker, which starts on the first full sentence.
+        # A cache miss fails before the first chunk, so PrefixCache can still
+        # resend without the cache.
+        chunks: List[str] = []
+        token = self.tts.begin() if speak else None
+        try:
+            for chunk in self.ai.chat_stream(
+                model_id=model_id,
+                messages=contents,
+                system_instruction=system_instruction,
+                cached_content=cached_content,
+            ):
+                chunks.append(chunk)
+                if token is not None:
+                    self.tts.feed(token, chunk)
+        finally:
+            if token is not None:
+                self.tts.end(token)
+        return "".join(chunks)
+
+    def _window_for(self, s: ChatSession, user_msg: Message) -> Tuple[List[Message], int]:
+        # Messages the user queued after this one are left out, and replies to
+        # earlier requests that landed after it go before it, so the request
+        # always ends with its own user turn. Only the last history_window
+        # messages are sent; also returns the index of the first one sent.
+        snapshot = list(s.messages)
+        at = next((i for i, m in enumerate(snapshot) if m is user_msg), len(snapshot))
+        order = list(range(at)) + [i for i in range(at + 1, len(snapshot)) if snapshot[i].role != "user"]
+        window = self.state.settings.history_window
+        if window > 0:
+            order = order[-(window - 1):] if window > 1 else []
+        first = min(order + [at])
+        return [snapshot[i] for i in order] + [user_msg], first
+
+    def _to_content(self, m: Message) -> dict:
+        role = "user" if m.role == "user" else "model"
+        p = []
+        if m.content:
+            p.append({"text": m.content})
+        for img in m.images:
+            # each image as inline_data, reusing the stored base64
+            part = attachments.inline_data(img)
+            if part is not None:
+                p.append(part)
+        return {"role": role, "parts": p}
+
+    def _memory_note(self, hits: List[Hit]) -> str:
+        if not hits:
+            return ""
+        lines = ["Relevant excerpts from earlier conversations, use them if they help:"]
+        for hit in hits:
+            session = self.state.get_session(hit.session_id)
+            title = session.title if session else "chat"
+            lines.append(f"- [{title}] {hit.text}")
+        return "\n".join(lines)
+
+    def _with_memory(self, system_instruction: str, hits: List[Hit]) -> str:
+        return "\n".join(filter(None, [system_instruction, self._memory_note(hits)]))
+
+    def _on_reply_ready(self, session_id: str, reply: str) -> None:
+        # Chat replies were already spoken while they streamed in
+        if session_id == self.state.active_session_id:
+            self.refresh()
+        else:
+            self.state.mark_unread(session_id)
+        self.session_activity.emit(session_id)
 
 
@@ -1,18 +1,39 @@
 from __future__ import annotations
 
-from PySide6.QtCore import Qt
-from PySide6.QtWidgets import QMainWindow, QSplitter, QWidget, QVBoxLayout
+import gc
+import threading
+import tracemalloc
+
+from PySide6.QtCore import QEvent, QObject, Qt, QTimer, Signal
+from PySide6.QtGui import QKeySequence, QShortcut
+from PySide6.QtWidgets import QApplication, QMainWindow, QMessageBox, QSplitter, QWidget, QVBoxLayout
 
 from app.core.ai_client import GeminiClient
+from app.core.attachments import attachments
+from app.core.context_cache import PrefixCache
+from app.core.diagnostics import MemoryDiagnostics
+from app.core.dispatcher import RequestDispatcher
+from app.core.image_store import ImageStore
+from app.core.markdown_renderer import highlight_cache_stats
+from app.core.memory import SemanticMemory
 from app.core.state import AppState
 from app.core.tts import TextToSpeech
 from app.core.stt import SpeechToText
 from app.ui.chat_sidebar import ChatSidebar
 from app.ui.chat_view import ChatView
 from app.ui.loading_screen import LoadingScreen
+from app.ui.prefetch import MessageHtmlCache, SessionPrefetcher
 from app.ui.settings_modal import SettingsModal
 
 
+class _StateEvents(QObject):
+    # Re-emits AppState callbacks from worker threads on the UI thread
+    loaded = Signal()
+    archived = Signal(int)
+    sessions_added = Signal(int)
+    session_unreadable = Signal(str, str, str)
+
+
 class MainWindow(QMainWindow):
     def __init__(self, state: AppState, ai: GeminiClient, tts: TextToSpeech, stt: SpeechToText) -> None:
         super().__init__()
@@ -22,6 +43,40 @@ class MainWindow(QMainWindow):
         self.ai = ai
         self.tts = tts
         self.stt = stt
+        self.html_cache = MessageHtmlCache()
+        self.prefetcher = SessionPrefetcher(state, self.html_cache)
+        self.dispatcher = RequestDispatcher()
+        self.images = ImageStore(state.storage_dir / "generated")
+        self.memory = SemanticMemory(state.storage_dir / "memory")
+        self.memory.attach(state)
+        self.prefix_cache = PrefixCache(ai)
+        self.prefix_cache.attach(state)
+        self._backfilling = threading.Lock()
+        threading.Thread(target=self._backfill_memory, daemon=True).start()
+        self._backfill_timer = QTimer(self)
+        self._backfill_timer.setSingleShot(True)
+        self._backfill_timer.setInterval(3000)
+        self._backfill_timer.timeout.connect(
+            lambda: threading.Thread(target=self._backfill_memory, daemon=True).start()
+        )
+        self._state_events = _StateEvents(self)
+        self._state_events.loaded.connect(self._on_state_loaded)
+        self.state.subscribe("loaded", self._state_events.loaded.emit)
+        self._state_events.archived.connect(lambda _count: self.sidebar.refresh())
+        self.state.subscribe("archived", self._state_events.archived.emit)
+        self._state_events.sessions_added.connect(self._on_sessions_added)
+        self.state.subscribe("sessions-added", self._state_events.sessions_added.emit)
+        self._state_events.session_unreadable.connect(self._on_session_unreadable)
+        self.state.subscribe("session-unreadable", self._state_events.session_unreadable.emit)
+
+        # Archive compaction runs once the user has been idle for a while
+        self._compacting = False
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.setInterval(120_000)
+        self._idle_timer.timeout.connect(self._compact_archive)
+        self._idle_timer.start()
+        QApplication.instance().installEventFilter(self)
 
         self.loading = LoadingScreen()
         self.setCentralWidget(self.loading)
@@ -29,15 +84,36 @@ class MainWindow(QMainWindow):
         # Build main UI
         self._build_main()
 
+        # Ctrl+Shift+M writes a memory report to <storage>/diagnostics
+        self.diagnostics = MemoryDiagnostics(state.storage_dir / "diagnostics")
+        self._register_probes()
+        QShortcut(QKeySequence("Ctrl+Shift+M"), self, activated=self._dump_memory)
+
     def _build_main(self) -> None:
         self.splitter = QSplitter()
         self.splitter.setChildrenCollapsible(False)
         self.splitter.setHandleWidth(4)
         self.splitter.setStyleSheet("QSplitter::handle { background: rgba(6,182,212,0.2); }")
 
-        self.sidebar = ChatSidebar(self.state, on_select=self._on_select_session)
+        self.sidebar = ChatSidebar(
+            self.state,
+            on_select=self._on_select_session,
+            on_hover=self.prefetcher.request,
+            is_pending=self.dispatcher.is_pending,
+        )
         self.sidebar.setFixedWidth(260)
-        self.chat = ChatView(self.state, self.ai, self.tts, self.stt)
+        self.chat = ChatView(
+            self.state,
+            self.ai,
+            self.tts,
+            self.stt,
+            html_cache=self.html_cache,
+            dispatcher=self.dispatcher,
+            images=self.images,
+            memory=self.memory,
+            prefix_cache=self.prefix_cache,
+        )
+        self.chat.session_activity.connect(lambda _sid: self.sidebar.refresh())
         self.chat.set_sidebar_toggler(self._toggle_sidebar)
         self.chat.set_open_settings(self._open_settings)
 
@@ -54,12 +130,103 @@ class MainWindow(QMainWindow):
         self._apply_sidebar_visibility()
         self._main_container = container
 
+    def _register_probes(self) -> None:
+        d = self.diagnostics
+        d.register("state", self.state.memory_stats)
+        d.register("html_cache", self.html_cache.stats)
+        d.register("highlight_cache", highlight_cache_stats)
+        d.register("qt_documents", self.chat.document_stats)
+        d.register("generated_images", self.images.stats)
+        d.register("semantic_memory", self.memory.stats)
+        d.register("attachments", attachments.stats)
+        d.register("prefix_cache", self.prefix_cache.stats)
+        d.register("stt_latency", lambda: {"backends": self.stt.stats.summary(), "bytes": 0})
+        d.register("ai_client", lambda: {
+            "generative_models": sum(1 for o in gc.get_objects() if type(o).__name__ == "GenerativeModel"),
+            "bytes": 0,
+        })
+
+    def _dump_memory(self) -> None:
+        first = not tracemalloc.is_tracing()
+        path = self.diagnostics.write()
+        text = f"Memory report written to:\n{path}"
+        if first:
+            text += "\n\nAllocation tracing is now on; the next report shows growth since this one."
+        QMessageBox.information(self, "Memory report", text)
+
     def hide_loading_show_main(self) -> None:
         self.setCentralWidget(self._main_container)
         self.chat.refresh()
+        self.prefetcher.prefetch_recent()
+        if self.state.index_recovery is not None:
+            moved_to, error = self.state.index_recovery
+            self.state.index_recovery = None
+            QMessageBox.warning(
+                self,
+                "Chat index rebuilt",
+                f"The chat index could not be read ({error}).\n\n"
+                f"It was kept as:\n{moved_to}\n\n"
+                f"{len(self.state.sessions)} chat(s) were recovered from their files; "
+                "titles were taken from their first messages and settings were reset.",
+            )
+        self._warn_stt_fallback()
+
+    def _warn_stt_fallback(self) -> None:
+        if self.stt.backend_warning:
+            QMessageBox.warning(self, "Speech recognition", self.stt.backend_warning)
+
+    def eventFilter(self, obj, event) -> bool:
+        if event.type() in (QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.Wheel):
+            self._idle_timer.start()
+        return False
+
+    def _compact_archive(self) -> None:
+        if self._compacting:
+            return
+        self._compacting = True
+
+        def run() -> None:
+            try:
+                self.state.archive_inactive()
+                self.images.collect_garbage(self.state.referenced_images())
+            finally:
+                self._compacting = False
+        threading.Thread(target=run, daemon=True).start()
+
+    def _backfill_memory(self) -> None:
+        # Serialised, so a pass after an import waits for the startup one
+        with self._backfilling:
+            self.state.wait_until_loaded()
+            self.memory.backfill(self.state)
+
+    def _on_sessions_added(self, _count: int) -> None:
+        self.sidebar.refresh()
+        # Imports add sessions batch by batch; index them once it goes quiet
+        self._backfill_timer.start()
+
+    def _on_session_unreadable(self, session_id: str, moved_to: str, error: str) -> None:
+        s = self.state.get_session(session_id)
+        title = s.title if s else session_id
+        QMessageBox.warning(
+            self,
+            "Chat history unreadable",
+            f"The history of \"{title}\" could not be read ({error}).\n\n"
+            f"The file was kept as:\n{moved_to}\n\nThe chat continues empty.",
+        )
+
+    def closeEvent(self, event) -> None:
+        # Queued requests are dropped; one already running finishes on its own
+        self.dispatcher.shutdown()
+        super().closeEvent(event)
+
+    def _on_state_loaded(self) -> None:
+        self.sidebar.refresh()
+        self._apply_sidebar_visibility()
+        self.prefetcher.prefetch_recent()
 
     def _on_select_session(self, session_id: str) -> None:
         self.chat.refresh()
+        self.prefetcher.prefetch_recent()
 
     def _toggle_sidebar(self) -> None:
         self.state.settings.sidebar_visible = not self.state.settings.sidebar_visible
@@ -77,6 +244,10 @@ class MainWindow(QMainWindow):
     def _open_settings(self) -> None:
         dlg = SettingsModal(self.state, self)
         if dlg.exec():
+            self.stt.set_backend(self.state.settings.stt_backend)
+            self._warn_stt_fallback()
+            if not self.state.settings.prefix_cache:
+                threading.Thread(target=self.prefix_cache.clear, daemon=True).start()
             self.chat.refresh()
 
 
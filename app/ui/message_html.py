@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import List, Optional, Tuple
+
+from app.core.attachments import attachments
+from app.core.markdown_renderer import render_markdown_body
+from app.core.state import Message
+
+# Messages per page in both message views and the prefetcher
+PAGE_SIZE = 50
+
+
+def bubble_colors(role: str) -> Tuple[str, str]:
+    # (background, text)
+    return ("#4f46e5", "#ffffff") if role == "user" else ("#374151", "#e5e7eb")
+
+
+def render_message_body(
+    msg: Message,
+    highlight: bool = True,
+    pending: Optional[List[Tuple[str, Optional[str]]]] = None,
+) -> str:
+    body = render_markdown_body(msg.content, highlight=highlight, pending=pending)
+    images_html = ""
+    for ref in msg.images:
+        # Encoded once per attachment and shared by every render of it
+        uri = attachments.data_uri(ref)
+        if uri is not None:
+            images_html += f'<img src="{uri}" />'
+    return images_html + body
+
+
+def wrap_bubble(msg: Message, body: str) -> str:
+    bubble_color, text_color = bubble_colors(msg.role)
+    return f"""
+    <div style="max-width: 72%; margin: 8px; padding: 10px 12px; border-radius: 12px; background:{bubble_color}; color:{text_color}; {'margin-left:auto;' if msg.role=='user' else 'margin-right:auto;'}">
+      {body}
+    </div>
+    """
+
+
+def render_bubble(
+    msg: Message,
+    highlight: bool = True,
+    pending: Optional[List[Tuple[str, Optional[str]]]] = None,
+) -> str:
+    return wrap_bubble(msg, render_message_body(msg, highlight, pending))
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QPoint, QRect, QSize, Qt, QTimer, QUrl, Signal
+from PySide6.QtGui import QAbstractTextDocumentLayout, QColor, QPainter, QPalette, QTextDocument
+from PySide6.QtWidgets import QAbstractItemView, QListView, QStyledItemDelegate, QStyleOptionViewItem
+
+from app.core.markdown_renderer import highlighter
+from app.core.state import ChatSession, Message
+from app.ui.message_html import PAGE_SIZE, bubble_colors
+from app.ui.prefetch import MessageHtmlCache
+
+BUBBLE_RATIO = 0.72
+MARGIN = 8
+PAD_X = 12
+PAD_Y = 10
+DOC_CACHE_SIZE = 400
+
+
+class MessageListModel(QAbstractListModel):
+    # Exposes messages from _first on; older pages are inserted at the top on
+    # demand so row heights are only ever computed for what was scrolled to.
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self._session: Optional[ChatSession] = None
+        self._first = 0
+        self._count = 0
+
+    def session(self) -> Optional[ChatSession]:
+        return self._session
+
+    def session_id(self) -> Optional[str]:
+        return self._session.id if self._session else None
+
+    def key(self, index) -> Tuple[Optional[str], int]:
+        return self.session_id(), self._first + index.row()
+
+    def set_session(self, session: ChatSession) -> None:
+        self.beginResetModel()
+        self._session = session
+        self._count = len(session.messages)
+        self._first = max(0, self._count - PAGE_SIZE)
+        self.endResetModel()
+
+    def sync(self) -> None:
+        # Messages are append-only, so new rows are only ever added at the end
+        count = len(self._session.messages) if self._session else 0
+        if count > self._count:
+            self.beginInsertRows(QModelIndex(), self._count - self._first, count - self._first - 1)
+            self._count = count
+            self.endInsertRows()
+
+    def has_older(self) -> bool:
+        return self._first > 0
+
+    def load_older(self) -> None:
+        first = max(0, self._first - PAGE_SIZE)
+        if first == self._first:
+            return
+        self.beginInsertRows(QModelIndex(), 0, self._first - first - 1)
+        self._first = first
+        self.endInsertRows()
+
+    def index_for_key(self, key: Tuple[Optional[str], int]) -> QModelIndex:
+        sid, absolute = key
+        if sid != self.session_id() or not self._first <= absolute < self._count:
+            return QModelIndex()
+        return self.index(absolute - self._first)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._count - self._first
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or self._session is None:
+            return None
+        msg = self._session.messages[self._first + index.row()]
+        if role == Qt.UserRole:
+            return msg
+        if role == Qt.DisplayRole:
+            return msg.content
+        return None
+
+
+class MessageDelegate(QStyledItemDelegate):
+    # Each message gets its own QTextDocument, kept in a bounded LRU. Changing
+    # the view width only re-runs layout (setTextWidth); heights are remembered
+    # separately so evicted documents don't need rebuilding to lay out the list.
+    # Documents start with plain code blocks; highlighting is queued when a row
+    # is sized (distance 1) and again at distance 0 when it is actually painted,
+    # or whenever the highlighter has moved on to a newer generation.
+    highlighted = Signal(object)
+
+    def __init__(self, html_cache: MessageHtmlCache, parent=None) -> None:
+        super().__init__(parent)
+        self._html = html_cache
+        self._docs: "OrderedDict[Tuple[str, int], QTextDocument]" = OrderedDict()
+        self._heights: Dict[Tuple[str, int], int] = {}
+        self._pending: Dict[Tuple[str, int], List[Tuple[str, Optional[str]]]] = {}
+        # (generation, distance) each pending document was last queued at
+        self._queued: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        self._width = 0
+
+    def set_width(self, width: int) -> None:
+        if width == self._width:
+            return
+        self._width = width
+        self._heights.clear()
+        text_width = self._text_width()
+        for doc in self._docs.values():
+            doc.setTextWidth(text_width)
+
+    def clear(self) -> None:
+        self._docs.clear()
+        self._heights.clear()
+        self._pending.clear()
+        self._queued.clear()
+        highlighter.new_generation()
+
+    def stats(self) -> Dict[str, int]:
+        # QTextDocument memory is not visible to Python; characters (UTF-16)
+        # plus embedded image resources are the closest proxy
+        chars = sum(doc.characterCount() for doc in self._docs.values())
+        return {"documents": len(self._docs), "chars": chars, "bytes": chars * 2, "heights": len(self._heights)}
+
+    def invalidate(self, key: Tuple[str, int]) -> None:
+        self._docs.pop(key, None)
+        self._heights.pop(key, None)
+        self._pending.pop(key, None)
+        self._queued.pop(key, None)
+
+    def _queue_highlight(self, key: Tuple[str, int], distance: int) -> None:
+        blocks = self._pending.get(key)
+        if not blocks:
+            return
+        queued = self._queued.get(key)
+        if queued is not None and queued[0] == highlighter.generation and queued[1] <= distance:
+            return
+        self._queued[key] = (highlighter.generation, distance)
+        for code, lang in blocks:
+            highlighter.submit(code, lang, distance, lambda: self.highlighted.emit(key), token=(self, key))
+
+    def _text_width(self) -> float:
+        return max(40.0, self._width * BUBBLE_RATIO - 2 * PAD_X)
+
+    def document(self, index) -> QTextDocument:
+        key = index.model().key(index)
+        doc = self._docs.get(key)
+        if doc is not None:
+            self._docs.move_to_end(key)
+            return doc
+        msg: Message = index.data(Qt.UserRole)
+        _, text_color = bubble_colors(msg.role)
+        doc = QTextDocument()
+        doc.setDocumentMargin(0)
+        doc.setDefaultStyleSheet(f"body {{ color: {text_color}; }}")
+        pending: List[Tuple[str, Optional[str]]] = []
+        doc.setHtml(self._html.body(index.model().session(), key[1], pending))
+        doc.setTextWidth(self._text_width())
+        if pending:
+            self._pending[key] = pending
+            self._queue_highlight(key, 1)
+        self._docs[key] = doc
+        if len(self._docs) > DOC_CACHE_SIZE:
+            self._docs.popitem(last=False)
+        return doc
+
+    def bubble_rect(self, row_rect: QRect, index) -> QRect:
+        doc = self.document(index)
+        msg: Message = index.data(Qt.UserRole)
+        width = int(min(doc.idealWidth(), self._text_width())) + 2 * PAD_X
+        height = int(doc.size().height()) + 2 * PAD_Y
+        left = row_rect.right() - MARGIN - width if msg.role == "user" else row_rect.left() + MARGIN
+        return QRect(left, row_rect.top() + MARGIN, width, height)
+
+    def sizeHint(self, option: QStyleOptionViewItem, index) -> QSize:
+        key = index.model().key(index)
+        height = self._heights.get(key)
+        if height is None:
+            height = self._heights[key] = int(self.document(index).size().height()) + 2 * PAD_Y + 2 * MARGIN
+        return QSize(self._width, height)
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index) -> None:
+        msg: Message = index.data(Qt.UserRole)
+        bubble_color, text_color = bubble_colors(msg.role)
+        doc = self.document(index)
+        self._queue_highlight(index.model().key(index), 0)
+        rect = self.bubble_rect(option.rect, index)
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(bubble_color))
+        painter.drawRoundedRect(rect, 12, 12)
+        painter.translate(rect.left() + PAD_X, rect.top() + PAD_Y)
+        ctx = QAbstractTextDocumentLayout.PaintContext()
+        ctx.palette.setColor(QPalette.Text, QColor(text_color))
+        doc.documentLayout().draw(painter, ctx)
+        painter.restore()
+
+
+class MessageListView(QListView):
+    # Alternative to the single QTextBrowser document: only the loaded pages are
+    # laid out and only visible bubbles are painted.
+    anchorClicked = Signal(QUrl)
+
+    def __init__(self, html_cache: MessageHtmlCache, parent=None) -> None:
+        super().__init__(parent)
+        self._model = MessageListModel(self)
+        self._delegate = MessageDelegate(html_cache, self)
+        self.setModel(self._model)
+        self.setItemDelegate(self._delegate)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.Adjust)
+        self.setMouseTracking(True)
+        self.setStyleSheet("QListView { background-color:#0b1020; border:none; }")
+        self._paging = False
+        self.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        self._delegate.highlighted.connect(self._on_highlighted)
+
+    def _on_highlighted(self, key) -> None:
+        index = self._model.index_for_key(key)
+        if not index.isValid():
+            return
+        self._delegate.invalidate(key)
+        self._model.dataChanged.emit(index, index)
+        self.scheduleDelayedItemsLayout()
+
+    def delegate_stats(self) -> Dict[str, int]:
+        return self._delegate.stats()
+
+    def show_session(self, session: ChatSession) -> None:
+        if session.id != self._model.session_id():
+            self._delegate.clear()
+            self._model.set_session(session)
+        else:
+            self._model.sync()
+        self._paging = True
+        QTimer.singleShot(0, lambda: self._restore_scroll(0))
+
+    def _on_scroll(self, value: int) -> None:
+        bar = self.verticalScrollBar()
+        if self._paging or value > bar.minimum() or not self._model.has_older():
+            return
+        # Keep the bubble under the viewport in place once the older page is inserted
+        from_bottom = bar.maximum() - value
+        self._paging = True
+        self._model.load_older()
+        QTimer.singleShot(0, lambda: self._restore_scroll(from_bottom))
+
+    def _restore_scroll(self, from_bottom: int) -> None:
+        self.doItemsLayout()
+        bar = self.verticalScrollBar()
+        bar.setValue(bar.maximum() - from_bottom)
+        self._paging = False
+
+    def resizeEvent(self, e) -> None:
+        self._delegate.set_width(self.viewport().width())
+        super().resizeEvent(e)
+
+    def _anchor_at(self, pos: QPoint) -> str:
+        index = self.indexAt(pos)
+        if not index.isValid():
+            return ""
+        rect = self._delegate.bubble_rect(self.visualRect(index), index)
+        if not rect.contains(pos):
+            return ""
+        doc = self._delegate.document(index)
+        local = pos - rect.topLeft() - QPoint(PAD_X, PAD_Y)
+        return doc.documentLayout().anchorAt(local.toPointF())
+
+    def mouseMoveEvent(self, e) -> None:
+        anchor = self._anchor_at(e.position().toPoint())
+        self.viewport().setCursor(Qt.PointingHandCursor if anchor else Qt.ArrowCursor)
+        super().mouseMoveEvent(e)
+
+    def mouseReleaseEvent(self, e) -> None:
+        if e.button() == Qt.LeftButton:
+            anchor = self._anchor_at(e.position().toPoint())
+            if anchor:
+                self.anchorClicked.emit(QUrl(anchor))
+                return
+        super().mouseReleaseEvent(e)
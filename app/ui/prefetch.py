@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import itertools
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.markdown_renderer import has_highlight
+from app.core.state import AppState, ChatSession
+from app.ui.message_html import PAGE_SIZE, render_message_body
+
+
+Block = Tuple[str, Optional[str]]
+
+
+class MessageHtmlCache:
+    # Rendered message bodies per session, LRU-bounded by session count and
+    # shared by both message views and the prefetcher. A body rendered with
+    # code blocks still waiting for the highlighter is stored together with
+    # those blocks, and is only rendered again once one of them is done.
+    # Renders still running on a background thread when a session is
+    # invalidated are not stored (the epoch has moved on).
+    def __init__(self, max_sessions: int = 8) -> None:
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[int, Tuple[str, Tuple[Block, ...]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+
+    def _entry(self, session_id: str, index: int) -> Optional[Tuple[str, Tuple[Block, ...]]]:
+        with self._lock:
+            bodies = self._sessions.get(session_id)
+            if bodies is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return bodies.get(index)
+
+    def get(self, session_id: str, index: int) -> Optional[str]:
+        entry = self._entry(session_id, index)
+        return entry[0] if entry is not None else None
+
+    def put(
+        self,
+        session_id: str,
+        index: int,
+        body: str,
+        pending: Tuple[Block, ...] = (),
+        epoch: Optional[int] = None,
+    ) -> None:
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            bodies = self._sessions.get(session_id)
+            if bodies is None:
+                bodies = self._sessions[session_id] = {}
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            bodies[index] = (body, pending)
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            bodies = [b for per_session in self._sessions.values() for b, _pending in per_session.values()]
+            sessions = len(self._sessions)
+        return {"sessions": sessions, "bodies": len(bodies), "bytes": sum(sys.getsizeof(b) for b in bodies)}
+
+    def body(
+        self,
+        session: ChatSession,
+        index: int,
+        pending: Optional[List[Block]] = None,
+    ) -> str:
+        # With `pending`, uncached code blocks render plain and are reported
+        # there for deferred highlighting; without it everything is highlighted.
+        entry = self._entry(session.id, index)
+        if entry is not None:
+            body, waiting = entry
+            if not waiting:
+                return body
+            if pending is not None and not any(has_highlight(code, lang) for code, lang in waiting):
+                pending.extend(waiting)
+                return body
+        epoch = self._epoch
+        blocks: List[Block] = []
+        body = render_message_body(session.messages[index], highlight=pending is None, pending=blocks)
+        if blocks:
+            pending.extend(blocks)
+        self.put(session.id, index, body, tuple(blocks), epoch)
+        return body
+
+
+class SessionPrefetcher:
+    # Renders the last page of sessions the user is likely to open next: the
+    # one under the mouse or keyboard focus in the sidebar (priority 0) and the
+    # most recently updated ones (priority 1). One background thread that
+    # yields between messages so it stays behind the UI thread.
+    def __init__(self, state: AppState, cache: MessageHtmlCache, recent: int = 3) -> None:
+        self.state = state
+        self.cache = cache
+        self.recent = recent
+        self._queue: "queue.PriorityQueue[Tuple[int, int, str]]" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        state.subscribe("session-deleted", self.cache.invalidate)
+
+    def request(self, session_id: str, priority: int = 0) -> None:
+        if session_id == self.state.active_session_id:
+            return
+        self._queue.put((priority, next(self._seq), session_id))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pytalk-prefetch", daemon=True)
+                self._thread.start()
+
+    def prefetch_recent(self) -> None:
+        sessions = [s for s in self.state.sessions if not s.archived]
+        sessions.sort(key=lambda s: s.updated_at, reverse=True)
+        for s in sessions[:self.recent]:
+            self.request(s.id, priority=1)
+
+    def _run(self) -> None:
+        while True:
+            priority, _, session_id = self._queue.get()
+            s = self.state.get_session(session_id)
+            # Archived sessions are only worth decompressing when pointed at
+            if s is None or (s.archived and priority > 0):
+                continue
+            loaded = s.is_materialized()
+            count = len(s.messages)
+            for i in range(max(0, count - PAGE_SIZE), count):
+                if self.cache.get(s.id, i) is None:
+                    self.cache.body(s, i)
+                time.sleep(0)
+            # Only the rendered page is kept; a history read just for it goes
+            # back to disk unless the user opened the session meanwhile
+            if not loaded:
+                self.state.unload_sessions([s.id])
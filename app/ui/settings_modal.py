@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from PySide6.QtCore import Qt
 from PySide6.QtWidgets import (
+    QCheckBox,
+    QComboBox,
     QDialog,
     QDialogButtonBox,
     QFormLayout,
@@ -11,12 +13,14 @@ from PySide6.QtWidgets import (
     QListWidget,
     QListWidgetItem,
     QPushButton,
+    QSpinBox,
     QTextEdit,
     QVBoxLayout,
     QWidget,
 )
 
 from app.core.state import AppState, ModelInfo
+from app.core.stt_backends import available_backends
 
 
 class SettingsModal(QDialog):
@@ -77,6 +81,37 @@ class SettingsModal(QDialog):
         btn_add.clicked.connect(self._add_model)
         layout.addWidget(btn_add)
 
+        archive_form = QFormLayout()
+        self.archive_days = QSpinBox()
+        self.archive_days.setRange(0, 3650)
+        self.archive_days.setSpecialValueText("Never")
+        self.archive_days.setSuffix(" days")
+        self.archive_days.setValue(self.state.settings.archive_after_days)
+        archive_form.addRow("Archive idle chats after", self.archive_days)
+        self.message_view = QComboBox()
+        self.message_view.addItem("Single document", "document")
+        self.message_view.addItem("Per-message list", "list")
+        self.message_view.setCurrentIndex(max(0, self.message_view.findData(self.state.settings.message_view)))
+        archive_form.addRow("Message view", self.message_view)
+        self.stt_backend = QComboBox()
+        for backend in available_backends():
+            self.stt_backend.addItem(backend.label, backend.name)
+        self.stt_backend.setCurrentIndex(max(0, self.stt_backend.findData(self.state.settings.stt_backend)))
+        archive_form.addRow("Speech recognition", self.stt_backend)
+        self.image_variants = QSpinBox()
+        self.image_variants.setRange(1, 8)
+        self.image_variants.setValue(self.state.settings.image_variants)
+        archive_form.addRow("Images per prompt", self.image_variants)
+        self.history_window = QSpinBox()
+        self.history_window.setRange(0, 1000)
+        self.history_window.setSpecialValueText("All")
+        self.history_window.setValue(self.state.settings.history_window)
+        archive_form.addRow("Messages sent per request", self.history_window)
+        self.prefix_cache = QCheckBox("Cache long prompts with the provider")
+        self.prefix_cache.setChecked(self.state.settings.prefix_cache)
+        archive_form.addRow("Context caching", self.prefix_cache)
+        layout.addLayout(archive_form)
+
         buttons = QDialogButtonBox(QDialogButtonBox.Close | QDialogButtonBox.Save)
         buttons.accepted.connect(self._save_and_close)
         buttons.rejected.connect(self.reject)
@@ -109,6 +144,12 @@ class SettingsModal(QDialog):
 
     def _save_and_close(self) -> None:
         self.state.settings.system_instruction = self.prompt.toPlainText().strip()
+        self.state.settings.archive_after_days = self.archive_days.value()
+        self.state.settings.message_view = self.message_view.currentData()
+        self.state.settings.stt_backend = self.stt_backend.currentData()
+        self.state.settings.image_variants = self.image_variants.value()
+        self.state.settings.history_window = self.history_window.value()
+        self.state.settings.prefix_cache = self.prefix_cache.isChecked()
         self.state.save()
         self.accept()
 
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from PySide6.QtCore import QObject, QTimer
+
+LOG_BYTES = 5 * 1024 * 1024
+
+
+def _stack_of(thread_id: int) -> List[str]:
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return []
+    return [
+        f"{Path(f.filename).name}:{f.lineno} {f.name}"
+        for f in traceback.extract_stack(frame)
+    ]
+
+
+def _site(stack: List[str]) -> str:
+    # Innermost frame in our own code, else the innermost frame
+    for entry in reversed(stack):
+        name = entry.split(":", 1)[0]
+        if name != "watchdog.py" and not name.startswith("<"):
+            return entry
+    return stack[-1] if stack else "?"
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class StallWatchdog(QObject):
+    # A QTimer on the UI thread stamps a heartbeat every `interval_ms`; a
+    # monitor thread notices when the stamp is older than `threshold_ms`,
+    # samples the UI thread's Python stack while it stays blocked, and once
+    # the loop runs again appends one JSON line per stall to `log_path`.
+    # Timer lateness doubles as an event-loop latency measurement.
+    def __init__(
+        self,
+        log_path: Path,
+        threshold_ms: int = 250,
+        interval_ms: int = 50,
+        parent: Optional[QObject] = None,
+    ) -> None:
+        super().__init__(parent)
+        self.log_path = log_path
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.stalls = 0
+        self._latency: Deque[float] = deque(maxlen=1000)
+        self._beat = time.monotonic()
+        self._main_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._on_beat)
+
+    def start(self) -> None:
+        self._main_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._timer.start()
+        self._thread = threading.Thread(target=self._monitor, name="pytalk-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._timer.stop()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+
+    def _on_beat(self) -> None:
+        now = time.monotonic()
+        self._latency.append(max(0.0, now - self._beat - self.interval))
+        self._beat = now
+
+    def latency(self) -> Dict[str, float]:
+        values = list(self._latency)
+        return {
+            "p50_ms": _percentile(values, 0.5) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+            "max_ms": max(values, default=0.0) * 1000,
+        }
+
+    def _monitor(self) -> None:
+        poll = min(self.interval, self.threshold / 4)
+        while not self._stop.wait(poll):
+            beat = self._beat
+            if time.monotonic() - beat < self.threshold:
+                continue
+            # Stalled: sample until the heartbeat moves again
+            samples: List[List[str]] = []
+            while self._beat == beat and not self._stop.is_set():
+                stack = _stack_of(self._main_id)
+                if stack:
+                    samples.append(stack)
+                self._stop.wait(poll)
+            if self._beat == beat:
+                return
+            self._record(self._beat - beat - self.interval, samples)
+
+    def _record(self, duration: float, samples: List[List[str]]) -> None:
+        sites = Counter(_site(s) for s in samples)
+        site, hits = sites.most_common(1)[0] if sites else ("?", 0)
+        stack = next((s for s in samples if _site(s) == site), [])
+        entry = {
+            "ts": time.time(),
+            "duration_ms": round(duration * 1000, 1),
+            "site": site,
+            "samples": len(samples),
+            "site_samples": hits,
+            "stack": stack,
+        }
+        with self._lock:
+            self.stalls += 1
+            try:
+                self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                if self.log_path.exists() and self.log_path.stat().st_size > LOG_BYTES:
+                    os.replace(self.log_path, self.log_path.with_suffix(".jsonl.1"))
+                with self.log_path.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError:
+                pass
+
+
+def summarize(log_path: Path, top: int = 10) -> Dict[str, Any]:
+    # Aggregate view of a stall log: overall numbers and the worst call sites
+    durations: List[float] = []
+    by_site: Dict[str, List[float]] = {}
+    try:
+        with log_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                durations.append(entry["duration_ms"])
+                by_site.setdefault(entry.get("site", "?"), []).append(entry["duration_ms"])
+    except OSError:
+        pass
+    sites = sorted(by_site.items(), key=lambda kv: sum(kv[1]), reverse=True)[:top]
+    return {
+        "stalls": len(durations),
+        "total_ms": round(sum(durations), 1),
+        "p50_ms": _percentile(durations, 0.5),
+        "p95_ms": _percentile(durations, 0.95),
+        "max_ms": max(durations, default=0.0),
+        "sites": [
+            {"site": site, "count": len(d), "total_ms": round(sum(d), 1), "max_ms": max(d)}
+            for site, d in sites
+        ],
+    }
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path.home() / ".pytalk" / "stalls.jsonl"
+    print(json.dumps(summarize(path), indent=2))